@@ -5,15 +5,14 @@ import shutil
 import sys
 import warnings
 import threading
+import multiprocessing
+import queue
 import subprocess
-from io import StringIO
 import json
-import tools.epub_processor as epub_processor 
-import tools.file_manager as file_manager
-import tools.text_extractor as text_extractor
-import tools.translator as translator
 import time
+import collections
 import traceback
+from tools.file_manager import get_base_path
 
 # Credential sample format
 """
@@ -30,53 +29,84 @@ import traceback
 }
 """
 
-def get_base_path():
-    """Return the base path for the application (handles PyInstaller bundle)."""
-    if getattr(sys, 'frozen', False):
-        return os.path.dirname(sys.executable)
-    else:
-        return os.getcwd()
+MAX_LOG_LINES = 5000
+
+def trim_log_widget(text_widget, max_lines=MAX_LOG_LINES):
+    """Delete the oldest lines so the log widget never holds more than max_lines."""
+    line_count = int(text_widget.index('end-1c').split('.')[0])
+    if line_count > max_lines:
+        text_widget.delete('1.0', f'{line_count - max_lines + 1}.0')
+
+def append_to_log(text_widget, text):
+    """Append text to the read-only log widget, following the tail only if the user is already there."""
+    at_bottom = text_widget.yview()[1] > 0.98
+    text_widget.config(state='normal')
+    text_widget.insert(tk.END, text)
+    trim_log_widget(text_widget)
+    text_widget.config(state='disabled')
+    if at_bottom:
+        text_widget.yview_moveto(1.0)
 
 class StreamRedirector:
     """Redirects stdout and stderr to the ScrolledText widget with buffered updates."""
-    def __init__(self, text_widget, original_stream):
+    def __init__(self, text_widget, original_stream, log_file=None):
         self.text_widget = text_widget
         self.original_stream = original_stream
-        self.buffer = StringIO()
-        self.text_buffer = []
-        self.update_interval = 100  # ms
-        self._schedule_update()
+        # Optional append-mode run.log; the widget stays bounded, the file keeps the full history
+        self.log_file = log_file
+        # Frozen windowed builds have no console stream; decide once instead of per flush
+        self._has_orig = original_stream is not None and hasattr(original_stream, 'write')
+        # Unbounded: every chunk reaches the widget; trim_log_widget bounds what it keeps
+        self.text_buffer = collections.deque()
+        self.update_interval = 50  # ms
+        self._alive = True
+        self._pending = False
 
     def write(self, text):
-        self.text_buffer.append(text)
-        if self.original_stream is not None and hasattr(self.original_stream, 'write'):
+        if not self._alive:
+            if self._has_orig:
+                self.original_stream.write(text)
+            return
+        # The console gets every write immediately; only the widget path is batched
+        if self._has_orig:
             try:
                 self.original_stream.write(text)
             except Exception:
                 pass
-        self.buffer.write(text)
+        self.text_buffer.append(text)
+        if self.log_file is not None:
+            try:
+                self.log_file.write(text)
+            except (OSError, ValueError):
+                pass
+        # Schedule a single flush per burst of writes instead of polling forever
+        if not self._pending and self._alive:
+            self._pending = True
+            try:
+                self.text_widget.after(self.update_interval, self._update_text)
+            except Exception:
+                self._pending = False
 
     def _update_text(self):
+        self._pending = False
+        if not self._alive:
+            return
         if self.text_buffer:
-            combined_text = ''.join(self.text_buffer)
-            self.text_buffer = []
+            parts = []
+            while self.text_buffer:
+                parts.append(self.text_buffer.popleft())
+            combined_text = ''.join(parts)
             try:
-                self.text_widget.config(state='normal')
-                self.text_widget.insert(tk.END, combined_text)
-                self.text_widget.yview(tk.END)
-                self.text_widget.config(state='disabled')
+                append_to_log(self.text_widget, combined_text)
             except Exception:
                 pass
-        self._schedule_update()
 
-    def _schedule_update(self):
-        try:
-            self.text_widget.after(self.update_interval, self._update_text)
-        except Exception:
-            pass
+    def stop(self):
+        """Stop scheduling widget updates (the widget is being destroyed)."""
+        self._alive = False
+        self.log_file = None
 
     def flush(self):
-        self.buffer.flush()
         if self.original_stream is not None and hasattr(self.original_stream, 'flush'):
             try:
                 self.original_stream.flush()
@@ -90,6 +120,14 @@ class TranslationApp:
         self.root.geometry("600x500")
         self.root.attributes('-topmost', False)
         self.is_translating = False
+        self._log_q = queue.Queue()
+        self._log_pending = False
+        self.log_interval = 50  # ms
+        self._alive = True
+        self._epub_filetypes = [("EPUB files", "*.epub")]
+        self._last_dir = os.path.expanduser('~')
+        self._credentials_cache = {}
+        self.job_queue = queue.Queue()
         
         self.base_dir = get_base_path()
         self.output_dir = os.path.join(self.base_dir, "output")
@@ -140,25 +178,57 @@ class TranslationApp:
         ttk.Button(self.main_frame, text="Focus Window", command=self.focus_window).grid(row=6, column=0, pady=10)
         ttk.Button(self.main_frame, text="Reveal Output", command=self.reveal_output).grid(row=7, column=1, pady=10)
         ttk.Label(self.main_frame, text="Log:").grid(row=8, column=0, sticky=tk.W, pady=5)
-        self.log_text = scrolledtext.ScrolledText(self.main_frame, width=60, height=15, wrap=tk.WORD)
+        self.log_text = scrolledtext.ScrolledText(self.main_frame, width=60, height=15, wrap=tk.WORD,
+                                                  undo=False, maxundo=0, autoseparators=False)
         self.log_text.grid(row=9, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S))
         self.log_text.config(state='disabled')
         
         self.main_frame.columnconfigure(1, weight=1)
         self.main_frame.rowconfigure(8, weight=1)
         
-        os.makedirs(self.output_dir, exist_ok=True)
-        os.makedirs(self.temp_dir, exist_ok=True)
-        os.makedirs(self.credential_dir, exist_ok=True)
+        for directory in (self.output_dir, self.temp_dir, self.credential_dir):
+            try:
+                os.mkdir(directory)
+            except FileExistsError:
+                pass
         
         self.original_stdout = sys.stdout
         self.original_stderr = sys.stderr
-        sys.stdout = StreamRedirector(self.log_text, sys.stdout)
-        sys.stderr = StreamRedirector(self.log_text, sys.stderr)
+        try:
+            self.run_log = open(os.path.join(self.base_dir, "run.log"), 'a', encoding='utf-8', buffering=8192)
+        except OSError:
+            self.run_log = None
+        self.stdout_redirector = StreamRedirector(self.log_text, sys.stdout, self.run_log)
+        self.stderr_redirector = StreamRedirector(self.log_text, sys.stderr, self.run_log)
+        sys.stdout = self.stdout_redirector
+        sys.stderr = self.stderr_redirector
+        self.root.bind('<Destroy>', self._on_destroy)
+        self.root.protocol('WM_DELETE_WINDOW', self._on_close)
         
         warnings.showwarning = self.redirect_warning
         
-        self.root.after(1000, self._check_responsiveness)
+        # Set on close so a running translation stops queuing API calls instead of outliving the window
+        self.cancel_event = threading.Event()
+        self.worker = threading.Thread(target=self._worker_loop, daemon=True)
+        self.worker.start()
+
+    def _on_close(self):
+        """Stop log pumping and hand stdout/stderr back before the window goes away."""
+        self._alive = False
+        self.cancel_event.set()
+        self.stdout_redirector.stop()
+        self.stderr_redirector.stop()
+        sys.stdout = self.original_stdout
+        sys.stderr = self.original_stderr
+        self.root.destroy()
+
+    def _on_destroy(self, event):
+        if event.widget is self.root:
+            self.stdout_redirector.stop()
+            self.stderr_redirector.stop()
+            if self.run_log is not None:
+                self.run_log.close()
+                self.run_log = None
 
     def load_credentials(self):
         credential_file = os.path.join(self.credential_dir, "credential.json")
@@ -166,6 +236,7 @@ class TranslationApp:
             if os.path.exists(credential_file):
                 with open(credential_file, 'r') as f:
                     credentials = json.load(f)
+                    self._credentials_cache = credentials
                     self.api_url_entry.insert(0, credentials.get('api_url', 'Replace by your API URL'))
                     self.api_key_entry.insert(0, credentials.get('api_key', 'Replace by your API key'))
                     self.model_entry.insert(0, credentials.get('model', 'Replace by your model'))
@@ -190,14 +261,17 @@ class TranslationApp:
             'model': model,
             'target_language': target_language
         }
+        if all(self._credentials_cache.get(key) == value for key, value in credentials.items()):
+            return
+        if self._credentials_cache.get('extra_body') is not None:
+            credentials['extra_body'] = self._credentials_cache['extra_body']
         try:
-            if os.path.exists(credential_file):
-                with open(credential_file, 'r') as f:
-                    existing = json.load(f)
-                    if existing.get('extra_body') is not None:
-                        credentials['extra_body'] = existing['extra_body']
-            with open(credential_file, 'w') as f:
-                json.dump(credentials, f, indent=4)
+            # Write to a temp file and swap it in so a crash never leaves a truncated file
+            tmp_file = credential_file + ".tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(credentials, f, separators=(',', ':'))
+            os.replace(tmp_file, credential_file)
+            self._credentials_cache = credentials
             self.write("Credentials saved successfully.\n")
         except Exception as e:
             self.write(f"Error saving credentials: {e}\n")
@@ -217,8 +291,9 @@ class TranslationApp:
 
     def browse_file(self):
         try:
-            file_path = filedialog.askopenfilename(filetypes=[("EPUB files", "*.epub")])
+            file_path = filedialog.askopenfilename(filetypes=self._epub_filetypes, initialdir=self._last_dir)
             if file_path:
+                self._last_dir = os.path.dirname(file_path)
                 self.file_entry.delete(0, tk.END)
                 self.file_entry.insert(0, file_path)
         except Exception as e:
@@ -226,50 +301,81 @@ class TranslationApp:
 
     def clear_temp(self):
         try:
-            if os.path.exists(self.temp_dir):
-                shutil.rmtree(self.temp_dir)
-                os.makedirs(self.temp_dir)
+            try:
+                with os.scandir(self.temp_dir) as entries:
+                    for entry in entries:
+                        if entry.is_file() or entry.is_symlink():
+                            try:
+                                os.unlink(entry.path)
+                            except OSError:
+                                pass
+                        else:
+                            shutil.rmtree(entry.path, ignore_errors=True)
                 self.write("Temp folder cleared successfully.\n")
-            else:
+            except FileNotFoundError:
+                os.mkdir(self.temp_dir)
                 self.write("Temp folder does not exist, created new one.\n")
-                os.makedirs(self.temp_dir)
         except Exception as e:
             self.write(f"Error clearing temp folder: {e}\n")
 
     def reveal_output(self):
         try:
-            if not os.path.exists(self.output_dir):
-                os.makedirs(self.output_dir)
+            try:
+                os.mkdir(self.output_dir)
                 self.write("Output folder created.\n")
+            except FileExistsError:
+                pass
             
             if sys.platform.startswith('win'):
                 os.startfile(self.output_dir)
-            elif sys.platform.startswith('darwin'):
-                subprocess.run(['open', self.output_dir], check=True)
             else:
-                subprocess.run(['xdg-open', self.output_dir], check=True)
+                opener = 'open' if sys.platform.startswith('darwin') else 'xdg-open'
+                # Fire and forget: the file browser runs in its own session and is never waited on
+                subprocess.Popen([opener, self.output_dir], stdin=subprocess.DEVNULL,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                 start_new_session=True)
             self.write("Output folder opened successfully.\n")
         except Exception as e:
             self.write(f"Error opening output folder: {e}\n")
 
     def write(self, text):
+        if not self._alive:
+            return
+        # Timestamp on the calling (usually worker) thread to keep the GUI flush cheap
+        self._log_q.put((time.time(), text))
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        """Arm a single _update_log call; later writes piggyback on it."""
+        if self._log_pending:
+            return
+        self._log_pending = True
         try:
-            self.root.after(0, self._update_log, text)
+            self.root.after(self.log_interval, self._update_log)
         except Exception:
-            if sys.stderr is not None and hasattr(sys.stderr, 'write'):
-                sys.stderr.write(text)
+            self._log_pending = False
 
-    def _update_log(self, text):
+    def _update_log(self):
+        """Flush all queued log messages to the widget in a single insert."""
+        self._log_pending = False
+        if not self._alive:
+            return
+        msgs = []
+        while True:
+            try:
+                msgs.append(self._log_q.get_nowait())
+            except queue.Empty:
+                break
+        if not msgs:
+            return
+        plain_text = ''.join(text for _, text in msgs)
         try:
-            self.log_text.config(state='normal')
-            self.log_text.insert(tk.END, f"[{time.time()}] {text}")
-            self.log_text.yview(tk.END)
-            self.log_text.config(state='disabled')
+            append_to_log(self.log_text, ''.join(['[%.3f] %s' % msg for msg in msgs]))
             if self.original_stdout is not None and hasattr(self.original_stdout, 'write'):
-                self.original_stdout.write(text)
+                self.original_stdout.write(plain_text)
         except Exception:
             if sys.stderr is not None and hasattr(sys.stderr, 'write'):
-                sys.stderr.write(text)
+                sys.stderr.write(plain_text)
 
     def flush(self):
         if self.original_stdout is not None and hasattr(self.original_stdout, 'flush'):
@@ -283,110 +389,115 @@ class TranslationApp:
             except Exception:
                 pass
 
-    def _check_responsiveness(self):
-        try:
-            self.root.after(100, self._check_responsiveness)
-        except Exception:
-            pass
-
     def translate(self):
         if self.is_translating:
             self.write("Translation already in progress. Please wait.\n")
             return
         self.is_translating = True
         self.translate_button.config(state='disabled')
-        
-        def run_translation():
+        # Read the widgets here on the GUI thread; the worker only sees plain values
+        self.job_queue.put((
+            self.file_entry.get(),
+            self.platform_var.get(),
+            self.api_url_entry.get(),
+            self.api_key_entry.get(),
+            self.model_entry.get(),
+            self.language_var.get(),
+        ))
+
+    def _worker_loop(self):
+        """Run queued translation jobs one at a time on a single long-lived thread."""
+        while True:
+            job = self.job_queue.get()
             try:
-                self.write(f"Starting translation thread at {time.time()}\n")
-                epub_path = self.file_entry.get()
-                platform = self.platform_var.get()
-                api_url = self.api_url_entry.get()
-                api_key = self.api_key_entry.get()
-                model = self.model_entry.get()
-                target_language = self.language_var.get()
-                
-                if not epub_path:
-                    self.write("Error: Please select an EPUB file.\n")
-                    return
-                if not api_url or not api_key or not model:
-                    self.write("Error: Please fill in all API fields.\n")
-                    return
-                if not platform:
-                    self.write("Error: Please select a platform.\n")
-                    return
-                if not target_language:
-                    self.write("Error: Please select a target language.\n")
-                    return
-                
-                self.save_credentials(api_url, api_key, model, target_language)
-                extra_body = None
-                try:
-                    credential_file = os.path.join(self.credential_dir, "credential.json")
-                    if os.path.exists(credential_file):
-                        with open(credential_file, 'r') as f:
-                            cred = json.load(f)
-                            extra_body = cred.get("extra_body")
-                except Exception:
-                    pass
-                
-                self.write("Starting EPUB processing...\n")
-                extract_dir = os.path.join(self.base_dir, "extracted_epub")
-                base_name_epub = os.path.basename(epub_path)
-                output_epub = os.path.join(self.output_dir, base_name_epub)
-                trans_epub = extract_dir
-                translation_json = os.path.join(self.temp_dir, 'updated_translations.json')
-                
-                # Extract EPUB first
-                self.write("Extracting EPUB...\n")
-                try:
-                    file_manager.file_manager(epub_path, extract_dir)
-                except Exception as e:
-                    self.write(f"Failed to extract EPUB: {str(e)}\n")
-                    self.write(traceback.format_exc() + "\n")
-                    return
-                
-                # Use TextExtractor to find the appropriate subfolder
-                self.write("Locating XHTML files...\n")
-                te = text_extractor.TextExtractor(
-                    input_dir=extract_dir,  # Start with the base extracted_epub directory
-                    output_file="dummy.txt",  # Dummy value, not used for finding files
-                    platform=platform
-                )
-                xhtml_folder, xhtml_files = te.find_xhtml_files()
-                
-                if not xhtml_folder or not xhtml_files:
-                    self.write("Error: No XHTML files found in the EPUB structure.\n")
-                    return
-                
-                input_dir = xhtml_folder  # Use the folder determined by TextExtractor
-                self.write(f"Using XHTML directory: {input_dir}\n")
-                
-                output_file = os.path.join(self.temp_dir, 'extracted_text.txt')
-                
-                self.write("Running EPUB processor...\n")
-                epub_processor.ebook_processor(platform)
-                self.write("Extracting text and generating translation cache...\n")
-                te = text_extractor.TextExtractor(input_dir, output_file, platform)
-                te.extract_text()
-                te.generate_translation_cache(output_file)  # Generate translation_cache.json
-                self.write("Translating JSON content...\n")
-                translator.gpt_translation(api_url=api_url, api_key=api_key, model=model, platform=platform, 
-                                         input_dir=input_dir, translation_json=translation_json, 
-                                         target_language=target_language, extra_body=extra_body)
-                self.write("Creating translated EPUB...\n")
-                file_manager.create_epub(trans_epub, output_epub)
-                self.write("Translation completed successfully!\n")
-                
-            except Exception as e:
-                self.write(f"Error during translation: {str(e)}\n")
-                self.write(traceback.format_exc() + "\n")
+                self.run_translation(*job)
             finally:
                 self.root.after(0, lambda: self.translate_button.config(state='normal'))
                 self.root.after(0, self.focus_window)
                 self.root.after(0, lambda: setattr(self, 'is_translating', False))
-                
-        threading.Thread(target=run_translation, daemon=True).start()
+
+    def run_translation(self, epub_path, platform, api_url, api_key, model, target_language):
+        try:
+            # Heavy dependencies (lxml, openai) load here, off the GUI thread
+            import tools.epub_processor as epub_processor
+            import tools.file_manager as file_manager
+            import tools.text_extractor as text_extractor
+            import tools.translator as translator
+            
+            self.write(f"Starting translation job at {time.time()}\n")
+            
+            if not epub_path:
+                self.write("Error: Please select an EPUB file.\n")
+                return
+            if not api_url or not api_key or not model:
+                self.write("Error: Please fill in all API fields.\n")
+                return
+            if not platform:
+                self.write("Error: Please select a platform.\n")
+                return
+            if not target_language:
+                self.write("Error: Please select a target language.\n")
+                return
+            
+            self.save_credentials(api_url, api_key, model, target_language)
+            extra_body = self._credentials_cache.get("extra_body")
+            
+            self.write("Starting EPUB processing...\n")
+            extract_dir = os.path.join(self.base_dir, "extracted_epub")
+            base_name_epub = os.path.basename(epub_path)
+            output_epub = os.path.join(self.output_dir, base_name_epub)
+            trans_epub = extract_dir
+            translation_json = os.path.join(self.temp_dir, 'updated_translations.json')
+            
+            # Extract EPUB first
+            self.write("Extracting EPUB...\n")
+            try:
+                file_manager.file_manager(epub_path, extract_dir, extract_assets=False)
+            except Exception as e:
+                self.write(f"Failed to extract EPUB: {str(e)}\n")
+                self.write(traceback.format_exc() + "\n")
+                return
+            
+            # Use TextExtractor to find the appropriate subfolder
+            self.write("Locating XHTML files...\n")
+            te = text_extractor.TextExtractor(
+                input_dir=extract_dir,  # Start with the base extracted_epub directory
+                output_file="dummy.txt",  # Dummy value, not used for finding files
+                platform=platform
+            )
+            xhtml_folder, xhtml_files = te.find_xhtml_files()
+            
+            if not xhtml_folder or not xhtml_files:
+                self.write("Error: No XHTML files found in the EPUB structure.\n")
+                return
+            
+            input_dir = xhtml_folder  # Use the folder determined by TextExtractor
+            self.write(f"Using XHTML directory: {input_dir}\n")
+            
+            output_file = os.path.join(self.temp_dir, 'extracted_text.txt')
+            
+            self.write("Running EPUB processor...\n")
+            epub_processor.ebook_processor(platform)
+            self.write("Extracting text and generating translation cache...\n")
+            te = text_extractor.TextExtractor(input_dir, output_file, platform)
+            te.extract_text()
+            te.generate_translation_cache(output_file)  # Generate translation_cache.json
+            self.write("Translating JSON content...\n")
+            try:
+                translator.gpt_translation(api_url=api_url, api_key=api_key, model=model, platform=platform, 
+                                         input_dir=input_dir, translation_json=translation_json, 
+                                         target_language=target_language, extra_body=extra_body,
+                                         cancel_event=self.cancel_event)
+            except translator.TranslationCancelled:
+                self.write("Translation cancelled.\n")
+                return
+            self.write("Creating translated EPUB...\n")
+            file_manager.create_epub(trans_epub, output_epub, source_epub=epub_path)
+            self.write("Translation completed successfully!\n")
+            
+        except Exception as e:
+            self.write(f"Error during translation: {str(e)}\n")
+            self.write(traceback.format_exc() + "\n")
 
 def main():
     try:
@@ -406,4 +517,5 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+
+from tools.epub_processor import EbookProcessor, _process_one
+from tools.text_extractor import _extract_one
+from tools.translator import _apply_translations
+
+XHTML_11 = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.1//EN" "http://www.w3.org/TR/xhtml11/DTD/xhtml11.dtd">\n'
+    '<html xmlns="http://www.w3.org/1999/xhtml"><head><title>t</title></head><body>{}</body></html>\n'
+)
+
+
+def kobo_page(body):
+    return XHTML_11.format(body).encode("utf-8")
+
+
+class RemoveFuriganaTest(unittest.TestCase):
+    def setUp(self):
+        self.processor = EbookProcessor(None, None, "kobo")
+
+    def test_rt_removed_and_tail_kept(self):
+        out = self.processor.process_bytes(kobo_page("<p><ruby>漢<rt>かん</rt></ruby>字です</p>")).decode("utf-8")
+        self.assertIn("<ruby>漢</ruby>字です", out)
+        self.assertNotIn("かん", out)
+
+    def test_self_closing_rt_only_removes_itself(self):
+        body = "<p><ruby>漢<rt/></ruby>字</p><p><ruby>読<rt>よ</rt></ruby>む</p>"
+        out = self.processor.process_bytes(kobo_page(body)).decode("utf-8")
+        self.assertIn("<p><ruby>漢</ruby>字</p>", out)
+        self.assertIn("<p><ruby>読</ruby>む</p>", out)
+
+    def test_undefined_entity_dropped_like_the_updater(self):
+        out = self.processor.process_bytes(kobo_page("<p>彼は&nbsp;言った</p>")).decode("utf-8")
+        self.assertIn("<p>彼は言った</p>", out)
+
+
+class ReplaceRubyTest(unittest.TestCase):
+    def test_nested_rb_markup_kept(self):
+        processor = EbookProcessor(None, None, "kindle")
+        body = "<p><ruby><rb><span>漢</span>字</rb><rt>かんじ</rt></ruby>です</p>"
+        out = processor.process_bytes(kobo_page(body)).decode("utf-8")
+        self.assertIn("<p>漢字です</p>", out)
+
+
+class KoboEntityRoundTripTest(unittest.TestCase):
+    def test_entity_paragraph_is_translated(self):
+        body = ('<p><span class="koboSpan" id="k1">彼は&nbsp;言った</span></p>'
+                '<p><span class="koboSpan" id="k2">&amp;と<ruby>漢<rt>かん</rt></ruby></span></p>')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "p-001.xhtml")
+            with open(path, "wb") as f:
+                f.write(EbookProcessor(None, None, "kobo").process_bytes(kobo_page(body)))
+
+            keys = [line for line in _extract_one((path, "kobo")).splitlines() if line]
+            self.assertEqual(keys, ["彼は言った", "&と漢"])
+
+            updated, _ = _apply_translations(path, {"彼は言った": "他說", "&と漢": "與漢"})
+            self.assertTrue(updated)
+            with open(path, encoding="utf-8") as f:
+                content = f.read()
+        self.assertIn(">他說</p>", content)
+        self.assertIn(">與漢</p>", content)
+
+
+
+class ProcessOneTest(unittest.TestCase):
+    def test_unparsable_file_reported_and_left_alone(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "empty.xhtml")
+            open(path, "wb").close()
+            rel_path, backup, error = _process_one((path, tmp + os.sep + "backup_dir_missing", "kobo"))
+            self.assertIsNone(backup)
+            self.assertTrue(error.startswith("I/O error"), error)
+
+            os.mkdir(os.path.join(tmp, "backup"))
+            rel_path, backup, error = _process_one((path, os.path.join(tmp, "backup"), "kobo"))
+            self.assertIsNone(backup)
+            self.assertTrue(error.startswith("Parse error"), error)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b"")
+
+
+if __name__ == "__main__":
+    unittest.main()
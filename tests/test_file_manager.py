@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+import zipfile
+
+from tools.file_manager import create_epub, find_subfolder_path, find_subfolder_paths
+
+
+def walk_find(root_folder, target_folder):
+    """The original single-target search, kept as the reference behaviour."""
+    for root, dirs, _ in os.walk(root_folder):
+        if target_folder in dirs:
+            return os.path.join(root, target_folder)
+    return None
+
+
+class FindSubfolderPathsTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = self._tmp.name
+        for rel in ("META-INF", "OEBPS/Text/book/xhtml", "OEBPS/Text/book/image", "OEBPS/Styles"):
+            os.makedirs(os.path.join(self.root, *rel.split("/")))
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_deeply_nested_folders_are_found(self):
+        found = find_subfolder_paths(self.root, ["xhtml", "image"])
+        self.assertEqual(found, {
+            "xhtml": os.path.join(self.root, "OEBPS", "Text", "book", "xhtml"),
+            "image": os.path.join(self.root, "OEBPS", "Text", "book", "image"),
+        })
+
+    def test_missing_target_is_absent(self):
+        found = find_subfolder_paths(self.root, ["Styles", "Fonts"])
+        self.assertEqual(found, {"Styles": os.path.join(self.root, "OEBPS", "Styles")})
+        self.assertIsNone(find_subfolder_path(self.root, "Fonts"))
+
+    def test_matches_single_target_walk(self):
+        os.makedirs(os.path.join(self.root, "OEBPS", "xhtml"))
+        for name in ("xhtml", "Text", "book", "OEBPS", "Fonts"):
+            self.assertEqual(find_subfolder_path(self.root, name), walk_find(self.root, name))
+        found = find_subfolder_paths(self.root, ["xhtml", "Text", "book"])
+        for name, path in found.items():
+            self.assertEqual(path, walk_find(self.root, name))
+
+
+class CreateEpubTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.folder = os.path.join(tmp.name, "extracted_epub")
+        self.output = os.path.join(tmp.name, "output", "book.epub")
+        for rel, data in (("mimetype", "application/epub+zip"), ("META-INF/container.xml", "<container/>"),
+                          ("OEBPS/text.xhtml", "<html>訳</html>")):
+            path = os.path.join(self.folder, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(data)
+        os.makedirs(os.path.dirname(self.output))
+        with zipfile.ZipFile(self.output, "w") as source:
+            source.writestr("mimetype", "application/epub+zip")
+            source.writestr("OEBPS/text.xhtml", "<html>原</html>")
+            source.writestr("OEBPS/cover.jpg", b"\xff\xd8jpeg")
+
+    def test_source_may_be_the_output(self):
+        create_epub(self.folder, self.output, source_epub=self.output)
+        with zipfile.ZipFile(self.output) as epub:
+            self.assertEqual(epub.namelist()[0], "mimetype")
+            self.assertEqual(epub.read("OEBPS/cover.jpg"), b"\xff\xd8jpeg")
+            self.assertEqual(epub.read("OEBPS/text.xhtml").decode("utf-8"), "<html>訳</html>")
+        self.assertEqual(os.listdir(os.path.dirname(self.output)), ["book.epub"])
+
+    def test_failed_build_keeps_existing_output(self):
+        with self.assertRaises(FileNotFoundError):
+            create_epub(self.folder, self.output, source_epub=self.output + ".missing")
+        with zipfile.ZipFile(self.output) as epub:
+            self.assertIn("OEBPS/cover.jpg", epub.namelist())
+        self.assertEqual(os.listdir(os.path.dirname(self.output)), ["book.epub"])
+
+
+if __name__ == "__main__":
+    unittest.main()
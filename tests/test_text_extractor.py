@@ -0,0 +1,220 @@
+import json
+import os
+import io
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
+
+from lxml import etree
+
+from tools import text_extractor
+
+from tools.text_extractor import _HTML_PARSER, TextExtractor, find_spine_files, _extract_content, kobo_paragraph_text, rewrite_ruby, stripped_text
+
+# Expected values match the original BeautifulSoup(content, "lxml") extraction (get_text(strip=True))
+PAGE = ('<?xml version="1.0" encoding="UTF-8"?>\n<html xmlns="http://www.w3.org/1999/xhtml">'
+        '<head><title>t</title></head><body>{}</body></html>')
+
+
+def extract(body, platform):
+    return _extract_content(PAGE.format(body).encode("utf-8"), platform)
+
+
+def first_p(body):
+    return etree.fromstring(PAGE.format(body).encode("utf-8"), _HTML_PARSER).find(".//p")
+
+
+class StrippedTextTest(unittest.TestCase):
+    def test_strips_each_text_node(self):
+        self.assertEqual(stripped_text(first_p("<p> a <b> b </b> c </p>")), "abc")
+
+    def test_entities_resolved(self):
+        self.assertEqual(stripped_text(first_p("<p>&amp; x&nbsp;y </p>")), "& x\xa0y")
+
+    def test_ruby_text_and_script_excluded(self):
+        p = first_p("<p><ruby>漢<rp>(</rp><rt>かん</rt><rp>)</rp></ruby>字<script>x()</script></p>")
+        self.assertEqual(stripped_text(p), "漢字")
+
+    def test_rt_itself_keeps_its_text(self):
+        rt = first_p("<p><ruby>漢<rt> かん </rt></ruby></p>").find(".//rt")
+        self.assertEqual(stripped_text(rt), "かん")
+
+
+class KoboParagraphTextTest(unittest.TestCase):
+    def test_no_kobo_span(self):
+        self.assertIsNone(kobo_paragraph_text(first_p("<p><span>x</span></p>")))
+
+    def test_joined_spans(self):
+        p = first_p('<p><span class="koboSpan"> 彼 </span><span class="x koboSpan"><b>は</b></span></p>')
+        self.assertEqual(kobo_paragraph_text(p), "彼は")
+
+    def test_ruby_inside_span(self):
+        p = first_p('<p><span class="koboSpan"><ruby>漢<rt>かん</rt></ruby>字</span></p>')
+        self.assertEqual(kobo_paragraph_text(p), "漢字")
+
+
+class ExtractKoboTest(unittest.TestCase):
+    def test_entities(self):
+        body = '<p><span class="koboSpan">　彼&amp;彼女 </span><span class="koboSpan">は&nbsp;言った</span></p>'
+        self.assertEqual(extract(body, "kobo"), "彼&彼女は\xa0言った\n\n")
+
+    def test_blank_lines_for_paragraphs_without_spans(self):
+        self.assertEqual(extract("<p>no span</p><p><br/></p><p></p>", "kobo"), "\n\n\n\n")
+
+    def test_nested_markup_and_section_marker(self):
+        body = '<p><span class="x koboSpan y">a <b>b</b> c</span>tail</p><p><span class="koboSpan">◇</span></p>'
+        self.assertEqual(extract(body, "kobo"), "abc\n◇\n\n")
+
+
+class ExtractKindleTest(unittest.TestCase):
+    def test_ruby_with_reading(self):
+        self.assertEqual(extract("<p><ruby><rb>漢字</rb><rt>かんじ</rt></ruby>です</p>", "kindle"), "漢字(かんじ)です\n\n")
+
+    def test_ruby_without_reading(self):
+        self.assertEqual(extract("<p><ruby><rb>東</rb></ruby>京</p>", "kindle"), "東京\n\n")
+
+    def test_nested_rb_and_spans(self):
+        body = '<p><ruby><rb><span>漢</span>字</rb><rt> かん じ </rt></ruby>と<span class="s91">、</span></p>'
+        self.assertEqual(extract(body, "kindle"), "漢字(かん じ)と、\n\n")
+
+    def test_entities_and_script(self):
+        body = "<p><ruby><rb>&amp;</rb><rt>あ</rt></ruby> a &nbsp; b <script>x()</script></p>"
+        self.assertEqual(extract(body, "kindle"), "&(あ)a \xa0 b\n\n")
+
+    def test_blank_paragraphs(self):
+        self.assertEqual(extract("<p>  </p><p><span> </span></p>", "kindle"), "\n\n\n")
+
+    def test_rewrite_ruby_leaves_complex_markup(self):
+        simple = "<ruby><rb>漢</rb><rt>かん</rt></ruby>"
+        nested = "<ruby><rb><span>漢</span></rb><rt>かん</rt></ruby>"
+        self.assertEqual(rewrite_ruby(simple), "<span>漢(かん)</span>")
+        self.assertEqual(rewrite_ruby(nested), nested)
+
+
+class GenerateTranslationCacheTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.text_file = os.path.join(tmp.name, "extracted_text.txt")
+        self.cache_file = os.path.join(tmp.name, "temp", "translation_cache.json")
+        self.extractor = TextExtractor("extracted_epub", self.text_file, "kobo", translation_file=self.cache_file)
+
+    def test_unique_lines_in_first_seen_order(self):
+        with open(self.text_file, "w", encoding="utf-8") as f:
+            f.write("二\n\n一\n  二  \n\n三\n一\n")
+        self.extractor.generate_translation_cache(self.text_file)
+        with open(self.cache_file, encoding="utf-8") as f:
+            cache = json.load(f)
+        self.assertEqual(list(cache.items()), [("二", ""), ("一", ""), ("三", "")])
+
+    def test_existing_cache_kept(self):
+        os.makedirs(os.path.dirname(self.cache_file))
+        with open(self.cache_file, "w", encoding="utf-8") as f:
+            f.write('{"一": "one"}')
+        with open(self.text_file, "w", encoding="utf-8") as f:
+            f.write("二\n")
+        self.extractor.generate_translation_cache(self.text_file)
+        with open(self.cache_file, encoding="utf-8") as f:
+            self.assertEqual(json.load(f), {"一": "one"})
+
+
+class ExtractTextStampTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.pages = []
+        for i in range(3):
+            path = Path(tmp.name, f"p{i}.xhtml")
+            path.write_bytes(PAGE.format(f"<p>行{i}</p>").encode("utf-8"))
+            self.pages.append(path)
+        self.output = os.path.join(tmp.name, "temp", "extracted_text.txt")
+        self.extractor = TextExtractor("extracted_epub", self.output, "kindle")
+        self.extractor.find_xhtml_files = lambda: (tmp.name, self.pages)
+        # Threads instead of processes so the patched worker function is seen
+        patcher = mock.patch.object(text_extractor, "ProcessPoolExecutor", ThreadPoolExecutor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read(self, path):
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+
+    def test_interrupted_run_is_not_reported_up_to_date(self):
+        self.extractor.extract_text()
+        self.assertEqual(self.read(self.output), "行0\n\n行1\n\n行2\n\n")
+        stamp = self.read(self.output + ".stamp")
+
+        self.pages[1].write_bytes(PAGE.format("<p>改</p>").encode("utf-8"))
+        real = text_extractor._extract_with_digest
+
+        def crash_on_last(args):
+            if args[0].endswith("p2.xhtml"):
+                raise RuntimeError("worker died")
+            return real(args)
+
+        with mock.patch.object(text_extractor, "_extract_with_digest", crash_on_last):
+            with self.assertRaises(RuntimeError):
+                self.extractor.extract_text()
+        # The previous output and its stamp are untouched, and no partial file is left behind
+        self.assertEqual(self.read(self.output), "行0\n\n行1\n\n行2\n\n")
+        self.assertEqual(self.read(self.output + ".stamp"), stamp)
+        self.assertFalse(os.path.exists(self.output + ".tmp"))
+
+        self.extractor.extract_text()
+        self.assertEqual(self.read(self.output), "行0\n\n改\n\n行2\n\n")
+
+
+class FindSpineFilesTest(unittest.TestCase):
+    CONTAINER = ('<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container"><rootfiles>'
+                 '<rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+                 '</rootfiles></container>')
+    OPF = ('<package xmlns="http://www.idpf.org/2007/opf"><manifest>'
+           '<item id="a" href="a.xhtml" media-type="application/xhtml+xml"/>'
+           '<item id="b" href="b.xhtml" media-type="application/xhtml+xml"/>'
+           '</manifest><spine><itemref idref="a"/><itemref idref="b"/></spine></package>')
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.base = tmp.name
+        self.write("META-INF/container.xml", self.CONTAINER)
+
+    def write(self, rel, text):
+        path = os.path.join(self.base, "extracted_epub", rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def lookup(self):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            result = find_spine_files(self.base)
+        return result, out.getvalue()
+
+    def test_failure_is_reported_every_time_and_not_cached(self):
+        for _ in range(2):
+            result, printed = self.lookup()
+            self.assertEqual(result, (None, None))
+            self.assertIn(".opf file not found", printed)
+        # Same container.xml stamp: a cached failure would still be returned here
+        self.write("OEBPS/content.opf", self.OPF)
+        self.write("OEBPS/a.xhtml", "<html/>")
+        self.write("OEBPS/b.xhtml", "<html/>")
+        (folder, files), printed = self.lookup()
+        self.assertEqual([os.path.basename(f) for f in files], ["a.xhtml", "b.xhtml"])
+        self.assertEqual(printed, "")
+
+    def test_warnings_repeat_on_cached_lookups(self):
+        self.write("OEBPS/content.opf", self.OPF)
+        self.write("OEBPS/a.xhtml", "<html/>")
+        for _ in range(2):
+            (folder, files), printed = self.lookup()
+            self.assertEqual([os.path.basename(f) for f in files], ["a.xhtml"])
+            self.assertIn("XHTML file not found", printed)
+
+
+if __name__ == "__main__":
+    unittest.main()
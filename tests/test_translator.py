@@ -0,0 +1,177 @@
+import os
+import re
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
+
+from openai import BadRequestError, InternalServerError
+
+from tools import translator
+from tools.translator import (MAX_BATCH_SPLIT_DEPTH, TEXT_ANALYZER, TranslationCache, TranslationCancelled, Translator,
+                              clean_response_lines, map_cancellable, normalize_key, pack_batches)
+
+PROMPTS = {"batch_prompt": "Translate:\n", "batch_system_prompt": "sys",
+           "single_prompt": "Translate: ", "single_system_prompt": "sys"}
+
+
+class ContextTooLong(BadRequestError):
+    def __init__(self):
+        Exception.__init__(self, "context too long")
+        self.code = "context_length_exceeded"
+
+
+class Unavailable(InternalServerError):
+    def __init__(self):
+        Exception.__init__(self, "service unavailable")
+
+
+class FakeCompletions:
+    """Answers numbered batch prompts line by line, or fails according to respond()."""
+
+    def __init__(self, respond=None):
+        self.respond = respond or (lambda lines: lines)
+        self.batch_sizes = []
+
+    def create(self, messages, **kwargs):
+        lines = re.findall(r'^\d+\. (.*)$', messages[-1]["content"], re.M)
+        self.batch_sizes.append(len(lines))
+        out = self.respond(lines) if lines else ["單"]
+        return SimpleNamespace(choices=[SimpleNamespace(
+            message=SimpleNamespace(content="\n".join(f"{i}. 譯{t}" for i, t in enumerate(out, 1)) if lines else out[0]),
+            finish_reason="stop")])
+
+
+class PackBatchesTest(unittest.TestCase):
+    def test_empty(self):
+        self.assertEqual(pack_batches([]), [])
+
+    def test_char_budget(self):
+        self.assertEqual(pack_batches(["aa", "bb", "cc"], max_chars=4), [["aa", "bb"], ["cc"]])
+
+    def test_item_cap(self):
+        self.assertEqual(pack_batches(list("abcde"), max_items=2), [["a", "b"], ["c", "d"], ["e"]])
+
+    def test_oversized_text_gets_its_own_batch(self):
+        self.assertEqual(pack_batches(["a", "x" * 10, "b"], max_chars=5), [["a"], ["x" * 10], ["b"]])
+
+
+class CleanResponseLinesTest(unittest.TestCase):
+    def test_matches_strip_then_prefix_removal(self):
+        text = " 1. 甲 \n\n2.乙\r\n  \n3. 3. 丙\n4.\n東京 1. 都"
+        self.assertEqual(clean_response_lines(text), ["甲", "乙", "3. 丙", "", "東京 1. 都"])
+
+    def test_blank_response(self):
+        self.assertEqual(clean_response_lines("\n \n"), [])
+
+
+class NormalizeKeyTest(unittest.TestCase):
+    def test_width_and_ideographic_space_folded(self):
+        self.assertEqual(normalize_key("ｱｲｳ　テスト１ "), "アイウ テスト1")
+
+    def test_nbsp_becomes_space(self):
+        self.assertEqual(normalize_key("彼は\xa0言った"), "彼は 言った")
+
+
+class GetValidTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.cache = TranslationCache(os.path.join(self._tmp.name, "cache.json"))
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_valid_missing_and_rejected(self):
+        self.cache.cache.update({"a": "甲", "b": "b", "c": "まだ", "d": "", "e": "他(かれ)"})
+        self.assertEqual(self.cache.get_valid("a", TEXT_ANALYZER), "甲")
+        self.assertEqual(self.cache.get_valid("e", TEXT_ANALYZER), "他(かれ)")
+        for key in ("b", "c", "d", "missing"):
+            self.assertIsNone(self.cache.get_valid(key, TEXT_ANALYZER))
+
+    def test_set_clears_rejection(self):
+        self.cache.cache["c"] = "まだ"
+        self.assertIsNone(self.cache.get_valid("c", TEXT_ANALYZER))
+        self.cache.set("c", "還")
+        self.assertEqual(self.cache.get_valid("c", TEXT_ANALYZER), "還")
+
+
+class MapCancellableTest(unittest.TestCase):
+    def test_results_in_order(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(map_cancellable(executor, lambda n: n * n, range(20), threading.Event(), 3))
+        self.assertEqual(results, [n * n for n in range(20)])
+
+    def test_cancel_stops_queuing_calls(self):
+        cancel = threading.Event()
+        calls = []
+
+        def fn(n):
+            calls.append(n)
+            if n == 2:
+                cancel.set()
+            return n
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            with self.assertRaises(TranslationCancelled):
+                list(map_cancellable(executor, fn, range(1000), cancel, 4))
+        self.assertEqual(calls, [0, 1, 2])
+
+
+class BatchSplitTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.cache = TranslationCache(os.path.join(self._tmp.name, "cache.json"))
+        with mock.patch.object(translator, "load_prompts", return_value=PROMPTS):
+            self.translator = Translator("http://127.0.0.1:9/v1", "k", "m")
+        patcher = mock.patch.object(translator.time, "sleep")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def use(self, completions):
+        self.translator._clients = [SimpleNamespace(chat=SimpleNamespace(completions=completions))]
+        return completions
+
+    def test_success_in_one_request(self):
+        fake = self.use(FakeCompletions())
+        result = self.translator.batch_translate_for_json(["あ", "い", "あ"], self.cache)
+        self.assertEqual(result, {"あ": "譯あ", "い": "譯い"})
+        self.assertEqual(fake.batch_sizes, [2])
+
+    def test_transient_errors_fail_the_batch_without_splitting(self):
+        def respond(lines):
+            raise Unavailable()
+        fake = self.use(FakeCompletions(respond))
+        texts = [f"文{i}" for i in range(8)]
+        self.cache.cache["文0"] = "句0"
+        result = self.translator.batch_translate_for_json(texts, self.cache)
+        self.assertEqual(fake.batch_sizes, [7, 7, 7])  # _chat's retries only
+        self.assertEqual(result, {"文0": "句0", **{t: t for t in texts[1:]}})
+
+    def test_misnumbered_response_splits_with_bounded_depth(self):
+        fake = self.use(FakeCompletions(lambda lines: lines[:-1] if len(lines) > 1 else lines))
+        texts = [f"文{i}" for i in range(16)]
+        result = self.translator.batch_translate_for_json(texts, self.cache)
+        self.assertEqual(fake.batch_sizes[0], 16)
+        self.assertEqual(len(fake.batch_sizes), 2 ** (MAX_BATCH_SPLIT_DEPTH + 1) - 1)
+        self.assertEqual(set(result), set(texts))
+        self.assertTrue(all(value == key for key, value in result.items()))
+
+    def test_context_too_long_splits_down_to_single_texts(self):
+        def respond(lines):
+            if len(lines) > 2:
+                raise ContextTooLong()
+            return lines
+        fake = self.use(FakeCompletions(respond))
+        texts = ["一", "二", "三", "四", "五"]
+        result = self.translator.batch_translate_for_json(texts, self.cache)
+        self.assertEqual(result, {"一": "譯一", "二": "譯二", "三": "單", "四": "譯四", "五": "譯五"})
+        self.assertEqual(fake.batch_sizes, [5, 2, 3, 0, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,21 +1,10 @@
-from bs4 import BeautifulSoup
+from lxml import etree
 import os
-from pathlib import Path
-import re
-import sys
-from tools.file_manager import find_subfolder_path
+from concurrent.futures import ProcessPoolExecutor
+from tools.file_manager import get_base_path, get_file_number, find_subfolder_path, list_xhtml_files
 
-def get_base_path():
-    """Return the base path for the application (handles PyInstaller bundle)."""
-    if getattr(sys, 'frozen', False):
-        return os.path.dirname(sys.executable)
-    else:
-        return os.getcwd()
-
-def get_file_number(filename):
-    """Extract numerical part from filename for sorting."""
-    match = re.search(r'(\d+)', os.path.basename(filename))
-    return int(match.group(1)) if match else float('inf')
+# Shared per (worker) process; no DTD loading or id bookkeeping. Blank text is kept because the tree is written back.
+_XHTML_PARSER = etree.XMLParser(huge_tree=True, recover=True, load_dtd=False, no_network=True, collect_ids=False)
 
 class EbookProcessor:
     def __init__(self, input_file, output_file, platform):
@@ -25,29 +14,46 @@ class EbookProcessor:
         self.base_dir = get_base_path()
 
     def remove_furigana(self, html_content):
-        soup = BeautifulSoup(html_content, 'xml')
-        for rt in soup.find_all('rt'):
-            rt.decompose()
-        return str(soup)
+        """Remove every <rt> element, keeping the text that follows it."""
+        # Parsed like the Kindle pass, so undefined entities (e.g. &nbsp;) are dropped here exactly as
+        # the translation update's parser drops them, and extractor and updater see the same text
+        tree = etree.fromstring(html_content, _XHTML_PARSER).getroottree()
+        for rt in list(tree.iter('{*}rt')):
+            _replace_with_text(rt, '')
+        return etree.tostring(tree, encoding='utf-8', xml_declaration=True)
 
-    def process_xhtml_file(self, input_file, output_file):
+    def replace_ruby(self, html_content):
+        """Replace every <ruby> element with the text of its <rb> children."""
+        tree = etree.fromstring(html_content, _XHTML_PARSER).getroottree()
+        for ruby in list(tree.iter('{*}ruby')):
+            kanji_text = ''.join(''.join(rb.itertext()) for rb in ruby.iter('{*}rb'))
+            _replace_with_text(ruby, kanji_text)
+        return etree.tostring(tree, encoding='utf-8', xml_declaration=True)
+
+    def process_bytes(self, content):
+        """Return the processed XHTML for the current platform (unchanged for unknown platforms)."""
         if self.platform == 'kobo':
-            with open(input_file, 'r', encoding='utf-8') as file:
-                content = file.read()
-            processed_content = self.remove_furigana(content)
-            with open(output_file, 'w', encoding='utf-8') as file:
-                file.write(processed_content)
+            return self.remove_furigana(content)
         elif self.platform == 'kindle':
-            with open(input_file, 'r', encoding='utf-8') as file:
-                content = file.read()
-            soup = BeautifulSoup(content, 'xml')
-            ruby_tags = soup.find_all('ruby')
-            for ruby in ruby_tags:
-                kanji_parts = ruby.find_all('rb')
-                kanji_text = ''.join(rb.get_text() for rb in kanji_parts)
-                ruby.replace_with(kanji_text)
-            with open(output_file, 'w', encoding='utf-8') as file:
-                file.write(str(soup))
+            return self.replace_ruby(content)
+        return content
+
+    def process_xhtml_file(self, input_file, output_file):
+        with open(input_file, 'rb') as file:
+            content = file.read()
+        with open(output_file, 'wb') as file:
+            file.write(self.process_bytes(content))
+
+def _replace_with_text(element, text):
+    """Remove element from its parent, splicing text (plus the element's tail) in its place."""
+    text += element.tail or ''
+    parent = element.getparent()
+    previous = element.getprevious()
+    if previous is not None:
+        previous.tail = (previous.tail or '') + text
+    else:
+        parent.text = (parent.text or '') + text
+    parent.remove(element)
 
 def ebook_processor(platform):
     base_dir = get_base_path()
@@ -59,8 +65,7 @@ def ebook_processor(platform):
         return
 
     # Find all XHTML files and sort by numerical order
-    part_files = list(Path(xhtml_dir).glob("*.xhtml"))
-    part_files = sorted(part_files, key=get_file_number)
+    part_files = sorted(list_xhtml_files(xhtml_dir), key=get_file_number)
 
     if not part_files:
         print(f"Warning: No XHTML files found in {xhtml_dir}.")
@@ -72,21 +77,38 @@ def ebook_processor(platform):
     backup_dir = os.path.join(base_dir, "extracted_epub", "xhtml_backup" if platform == 'kobo' else "OEBPS_backup")
     os.makedirs(backup_dir, exist_ok=True)
 
-    processor = EbookProcessor(None, None, platform)
+    jobs = [(str(file_path), backup_dir, platform) for file_path in part_files]
+    # The default worker count is os.cpu_count(), capped at the 61 that Windows allows
+    with ProcessPoolExecutor() as executor:
+        for rel_path, rel_backup, error in executor.map(_process_one, jobs, chunksize=8):
+            if error:
+                print(error)
+            else:
+                print(f"Processing file: {rel_path}\n"
+                      f"Completed processing: {rel_path} (Backup saved to {rel_backup})")
 
-    for file_path in part_files:
-        rel_path = os.path.relpath(file_path, base_dir)
-        try:
-            backup_path = os.path.join(backup_dir, file_path.name)
-            with open(file_path, 'r', encoding='utf-8') as src, open(backup_path, 'w', encoding='utf-8') as dst:
-                dst.write(src.read())
+def _process_one(args):
+    """Back up and process a single XHTML file. Runs in a worker process."""
+    file_path, backup_dir, platform = args
+    base_dir = get_base_path()
+    rel_path = os.path.relpath(file_path, base_dir)
+    try:
+        backup_path = os.path.join(backup_dir, os.path.basename(file_path))
+        # Read the source once; the same bytes feed both the backup and the transform
+        with open(file_path, 'rb') as src:
+            content = src.read()
+        with open(backup_path, 'wb') as dst:
+            dst.write(content)
 
-            print(f"Processing file: {rel_path}")
-            processor.process_xhtml_file(str(file_path), str(file_path))
-            print(f"Completed processing: {rel_path} (Backup saved to {os.path.relpath(backup_path, base_dir)})")
-        except PermissionError as e:
-            print(f"Permission error: Unable to process {rel_path}: {str(e)}")
-        except UnicodeDecodeError as e:
-            print(f"Encoding error: Unable to read {rel_path}: {str(e)}")
-        except Exception as e:
-            print(f"Unknown error processing {rel_path}: {str(e)}")
\ No newline at end of file
+        processed_content = EbookProcessor(None, None, platform).process_bytes(content)
+        with open(file_path, 'wb') as dst:
+            dst.write(processed_content)
+        return rel_path, os.path.relpath(backup_path, base_dir), None
+    except PermissionError as e:
+        return rel_path, None, f"Permission error: Unable to process {rel_path}: {str(e)}"
+    except OSError as e:
+        return rel_path, None, f"I/O error: Unable to process {rel_path}: {str(e)}"
+    except etree.LxmlError as e:
+        return rel_path, None, f"Parse error: Unable to parse {rel_path}: {str(e)}"
+    except Exception as e:
+        return rel_path, None, f"Unknown error processing {rel_path}: {str(e)}"
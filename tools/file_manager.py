@@ -1,10 +1,20 @@
 import zipfile
 import os
+import functools
 import shutil
 from pathlib import Path
 import sys
 import re
+import json
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
+# Already-compressed assets gain nothing from deflate, so they are stored as-is
+STORED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.woff', '.woff2', '.otf', '.ttf', '.mp3', '.mp4')
+
+@functools.lru_cache(maxsize=1)
 def get_base_path():
     """Return the base path for the application (handles PyInstaller bundle)."""
     if getattr(sys, 'frozen', False):
@@ -12,57 +22,102 @@ def get_base_path():
     else:
         return os.getcwd()
 
+_NUM_RE = re.compile(r'(\d+)')
+
+def get_file_number(filename):
+    """Extract numerical part from filename for sorting."""
+    name = filename.name if isinstance(filename, Path) else os.path.basename(filename)
+    match = _NUM_RE.search(name)
+    return int(match.group(1)) if match else float('inf')
+
+def find_subfolder_paths(root_folder, target_folders):
+    """
+    Search root_folder for several subfolder names in one os.walk pass, stopping once all are found.
+    Returns a dict mapping each found name to its first match in walk order (as find_subfolder_path).
+    """
+    targets = set(target_folders)
+    found = {}
+    for root, dirs, _ in os.walk(root_folder):
+        for name in targets.intersection(dirs).difference(found):
+            found[name] = os.path.join(root, name)
+        if len(found) == len(targets):
+            break
+    return found
+
 def find_subfolder_path(root_folder, target_folder):
     """Search for a subfolder within root_folder and return its path."""
-    for root, dirs, _ in os.walk(root_folder):
-        if target_folder in dirs:
-            return os.path.join(root, target_folder)
-    return None
+    return find_subfolder_paths(root_folder, [target_folder]).get(target_folder)
+
+def list_xhtml_files(folder):
+    """Return the paths of the .xhtml files directly inside folder, using DirEntry type info instead of extra stats."""
+    with os.scandir(folder) as entries:
+        return [entry.path for entry in entries if entry.name.endswith(".xhtml") and entry.is_file()]
+
+def dumps_json(obj):
+    """Serialize obj to indented UTF-8 JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+
+def loads_json(data):
+    """Parse JSON bytes; both parsers raise json.JSONDecodeError on bad input."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def is_stored_asset(name):
+    """True for already-compressed binary assets (images, fonts, media) that are never edited."""
+    return name.lower().endswith(STORED_EXTENSIONS)
 
 class FileManager:
-    def __init__(self, epub_path, extract_dir):
+    def __init__(self, epub_path, extract_dir, extract_assets=True):
         self.epub_path = epub_path
         self.extract_dir = extract_dir
+        self.extract_assets = extract_assets
         self.base_dir = get_base_path()
         
     def file_unzip(self):
         # Ensure extract_dir is absolute
         extract_dir = os.path.join(self.base_dir, self.extract_dir)
         
-        # Delete the directory if it already exists
-        if os.path.exists(extract_dir):
-            shutil.rmtree(extract_dir)
-            print(f"Removed existing directory: {extract_dir}")
-        # Create the directory if it doesn't exist
-        if not os.path.exists(extract_dir):
-            os.makedirs(extract_dir)
+        # Start from an empty directory
+        shutil.rmtree(extract_dir, ignore_errors=True)
+        os.makedirs(extract_dir, exist_ok=True)
 
         # Extract the epub
         with zipfile.ZipFile(self.epub_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_dir)
+            members = zip_ref.namelist()
+            if not self.extract_assets:
+                # Binary assets stay in the archive; create_epub copies them from source_epub
+                members = [name for name in members if not is_stored_asset(name)]
+            zip_ref.extractall(extract_dir, members)
+            entry_count = len(members)
             
-        print(f"EPUB extracted to {extract_dir}")
-
-        # List the extracted files
-        for root, dirs, files in os.walk(extract_dir):
-            level = root.replace(extract_dir, '').count(os.sep)
-            indent = ' ' * 4 * level
-            print(f"{indent}{os.path.basename(root)}/")
-            sub_indent = ' ' * 4 * (level + 1)
-            for file in files:
-                print(f"{sub_indent}{file}")
+        print(f"Extracted {entry_count} entries to {extract_dir}")
+
+        # List the extracted files (debug only, set EPUB_VERBOSE=1)
+        if os.environ.get("EPUB_VERBOSE"):
+            for root, dirs, files in os.walk(extract_dir):
+                level = root.replace(extract_dir, '').count(os.sep)
+                indent = ' ' * 4 * level
+                print(f"{indent}{os.path.basename(root)}/")
+                sub_indent = ' ' * 4 * (level + 1)
+                for file in files:
+                    print(f"{sub_indent}{file}")
 
-def file_manager(epub_path, extract_dir):
-    fm = FileManager(epub_path, extract_dir)
+def file_manager(epub_path, extract_dir, extract_assets=True):
+    fm = FileManager(epub_path, extract_dir, extract_assets)
     fm.file_unzip()
 
-def create_epub(trans_epub, output_epub):
+def create_epub(trans_epub, output_epub, source_epub=None):
     """
     Convert a folder with EPUB contents into a valid EPUB file.
     
     Args:
         trans_epub (str): Path to the folder containing EPUB contents.
         output_epub (str): Path for the output .epub file.
+        source_epub (str): Optional original .epub; binary assets that were not
+            extracted are streamed straight from it instead of from disk.
     """
     base_dir = get_base_path()
     trans_epub = os.path.join(base_dir, trans_epub)
@@ -78,21 +133,50 @@ def create_epub(trans_epub, output_epub):
         raise FileNotFoundError("Missing 'META-INF/container.xml' in EPUB folder.")
     
     # Create EPUB (ZIP) file
-    with zipfile.ZipFile(output_epub, "w", compression=zipfile.ZIP_DEFLATED) as epub:
+    epub_root = str(epub_folder)
+    mimetype_path = os.path.join(epub_root, "mimetype")
+    # Build next to the output and swap it in at the end: source_epub may be the output path itself
+    tmp_epub = output_epub.with_name(output_epub.name + ".tmp")
+    try:
+        _write_epub(tmp_epub, epub_root, mimetype_path, source_epub)
+        os.replace(tmp_epub, output_epub)
+    except BaseException:
+        if tmp_epub.exists():
+            tmp_epub.unlink()
+        raise
+    
+    print(f"EPUB created successfully: {output_epub}")
+
+def _write_epub(output_epub, epub_root, mimetype_path, source_epub):
+    """Zip epub_root into output_epub, mimetype first, streaming binary assets from source_epub."""
+    with zipfile.ZipFile(output_epub, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as epub:
         # Write mimetype file first, uncompressed
-        mimetype_path = epub_folder / "mimetype"
         epub.write(mimetype_path, "mimetype", compress_type=zipfile.ZIP_STORED)
         
         # Walk through the folder and add all other files
-        for root, dirs, files in os.walk(epub_folder):
+        for root, dirs, files in os.walk(epub_root):
             for file in files:
-                file_path = Path(root) / file
+                file_path = os.path.join(root, file)
                 # Skip mimetype as it's already added
                 if file_path == mimetype_path:
                     continue
                 # Calculate the relative path for the ZIP
-                arcname = file_path.relative_to(epub_folder)
-                # Add file to ZIP with compression
-                epub.write(file_path, arcname, compress_type=zipfile.ZIP_DEFLATED)
-    
-    print(f"EPUB created successfully: {output_epub}")
\ No newline at end of file
+                arcname = os.path.relpath(file_path, epub_root).replace(os.sep, '/')
+                # Add file to ZIP, compressing only assets that benefit from it
+                if file.lower().endswith(STORED_EXTENSIONS):
+                    compress_type = zipfile.ZIP_STORED
+                else:
+                    compress_type = zipfile.ZIP_DEFLATED
+                epub.write(file_path, arcname, compress_type=compress_type)
+        
+        # Copy binary assets straight from the source archive, one member at a time
+        if source_epub is not None:
+            with zipfile.ZipFile(source_epub, 'r') as source:
+                for info in source.infolist():
+                    if info.is_dir() or not is_stored_asset(info.filename):
+                        continue
+                    asset_info = zipfile.ZipInfo(info.filename, info.date_time)
+                    asset_info.compress_type = zipfile.ZIP_STORED
+                    asset_info.file_size = info.file_size
+                    with source.open(info) as src, epub.open(asset_info, 'w') as dst:
+                        shutil.copyfileobj(src, dst)
\ No newline at end of file
@@ -1,23 +1,263 @@
 import os
+import functools
 import re
-import json
-from bs4 import BeautifulSoup
-import sys
-from tools.file_manager import find_subfolder_path
+import hashlib
+from lxml import etree
+from tools.file_manager import get_base_path, get_file_number, find_subfolder_paths, list_xhtml_files, dumps_json
 from pathlib import Path
-import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
 
-def get_base_path():
-    """Return the base path for the application (handles PyInstaller bundle)."""
-    if getattr(sys, 'frozen', False):
-        return os.path.dirname(sys.executable)
-    else:
-        return os.getcwd()
+# Same libxml2 HTML parser BeautifulSoup(content, "lxml") used, so the tree (and the text) is unchanged
+_HTML_PARSER = etree.HTMLParser(encoding="utf-8", huge_tree=True, no_network=True, collect_ids=False,
+                               remove_blank_text=True)
+# container.xml / .opf: strict (errors are reported), no DTDs, entities or id bookkeeping
+_METADATA_PARSER = etree.XMLParser(load_dtd=False, no_network=True, resolve_entities=False, collect_ids=False,
+                                   remove_blank_text=True)
+_KOBO_SPAN_XPATH = etree.XPath(".//span[contains(concat(' ', normalize-space(@class), ' '), ' koboSpan ')]")
 
-def get_file_number(filename):
-    """Extract numerical part from filename for sorting."""
-    match = re.search(r'(\d+)', os.path.basename(filename))
-    return int(match.group(1)) if match else float('inf')
+# Simple kindle <ruby> pairs are rewritten to kanji(furigana) before parsing; anything with
+# nested markup or entities is left for kindle_paragraph_text. The <span> keeps the result a
+# separate text node, so surrounding whitespace is stripped exactly as before.
+_RUBY_RE = re.compile(r'<ruby\b[^>]*>\s*<rb\b[^>]*>\s*([^<&]*?)\s*</rb>\s*<rt\b[^>]*>\s*([^<&]*?)\s*</rt>\s*</ruby>')
+_RUBY_RB_ONLY_RE = re.compile(r'<ruby\b[^>]*>\s*<rb\b[^>]*>\s*([^<&]*?)\s*</rb>\s*</ruby>')
+
+def rewrite_ruby(content):
+    """Replace simple <ruby><rb>kanji</rb><rt>furigana</rt></ruby> markup in raw XHTML with kanji(furigana)."""
+    content = _RUBY_RE.sub(r'<span>\1(\2)</span>', content)
+    return _RUBY_RB_ONLY_RE.sub(r'<span>\1</span>', content)
+
+# BeautifulSoup keeps strings inside these tags out of an ancestor's get_text()
+_STRING_CONTAINERS = {"rt", "rp", "script", "style", "template"}
+# Also match the namespaced tags of XHTML parsed as XML (see translator's XHTML update)
+_STRING_CONTAINERS |= {"{http://www.w3.org/1999/xhtml}" + tag for tag in _STRING_CONTAINERS}
+
+_BODY_STRING_CONTAINER_XPATH = etree.XPath(
+    "boolean(//body//*[self::rt or self::rp or self::script or self::style or self::template])")
+_HAS_STRING_CONTAINER_XPATH = etree.XPath(
+    "boolean(.//rt | .//rp | .//script | .//style | .//template"
+    " | ancestor::rt | ancestor::rp | ancestor::script | ancestor::style | ancestor::template)")
+
+def _collect_text(element, parts, container, wanted):
+    own = element.tag if element.tag in _STRING_CONTAINERS else container
+    if element.text and own == wanted:
+        parts.append(element.text.strip())
+    for child in element:
+        if isinstance(child.tag, str):
+            _collect_text(child, parts, own, wanted)
+        if child.tail and own == wanted:
+            parts.append(child.tail.strip())
+
+def stripped_text(element):
+    """Text of element with every text node stripped, like BeautifulSoup's get_text(strip=True)."""
+    wanted = element.tag if element.tag in _STRING_CONTAINERS else None
+    container = next((a.tag for a in element.iterancestors() if a.tag in _STRING_CONTAINERS), None)
+    parts = []
+    _collect_text(element, parts, container, wanted)
+    return "".join(parts)
+
+def kobo_paragraph_text(p, spans=None, plain=None):
+    """
+    Joined koboSpan text of a <p>, or None when the paragraph has no koboSpan elements.
+    spans and plain can be precomputed per file (see _extract_content) to skip the per-paragraph XPath calls.
+    """
+    if spans is None:
+        spans = _KOBO_SPAN_XPATH(p)
+    if not spans:
+        return None
+    if plain is None:
+        plain = not _HAS_STRING_CONTAINER_XPATH(p)
+    if not plain:
+        return "".join(stripped_text(span) for span in spans)
+    # Plain paragraph: leaf koboSpans hold their text directly, others need only itertext()
+    return "".join((span.text or "").strip() if len(span) == 0 else "".join(text.strip() for text in span.itertext())
+                   for span in spans)
+
+def kindle_paragraph_text(element, parts=None):
+    """Text of a <p> with <ruby> rendered as kanji(furigana) and spans flattened to their text."""
+    top = parts is None
+    if top:
+        parts = []
+    if element.text:
+        parts.append(element.text.strip())
+    for child in element:
+        if child.tag == "ruby":
+            rb = next(child.iter("rb"), None)  # Kanji
+            rt = next(child.iter("rt"), None)  # Furigana
+            if rb is not None and rt is not None:
+                parts.append(f"{stripped_text(rb)}({stripped_text(rt)})")
+            elif rb is not None:
+                parts.append(stripped_text(rb))
+            else:
+                kindle_paragraph_text(child, parts)
+        elif isinstance(child.tag, str) and child.tag not in _STRING_CONTAINERS:
+            kindle_paragraph_text(child, parts)
+        if child.tail:
+            parts.append(child.tail.strip())
+    if top:
+        return "".join(parts)
+
+def _extract_one(args):
+    """Extract the text of a single XHTML file. Runs in a worker process."""
+    file_path, platform = args
+    with open(file_path, "rb") as infile:
+        return _extract_content(infile.read(), platform)
+
+def _extract_with_digest(args):
+    """Like _extract_one, but also return the file's digest (see _inputs_digest) from the same read."""
+    file_path, platform = args
+    with open(file_path, "rb") as infile:
+        content = infile.read()
+    return _extract_content(content, platform), _file_digest(content)
+
+def _extract_content(content, platform):
+    """Extract the paragraph text of one XHTML document (bytes) for the given platform."""
+    # Parse the XHTML with lxml directly
+    if platform == 'kindle' and b"<ruby" in content:
+        content = rewrite_ruby(content.decode("utf-8")).encode("utf-8")
+    root = etree.fromstring(content, _HTML_PARSER)
+    lines = []
+    if root is not None:
+        if platform == 'kobo':
+            # One XPath over the whole file, grouping each koboSpan under every <p> that contains it
+            spans_by_p = {}
+            for span in _KOBO_SPAN_XPATH(root):
+                for ancestor in span.iterancestors("p"):
+                    spans_by_p.setdefault(ancestor, []).append(span)
+            plain = not _BODY_STRING_CONTAINER_XPATH(root)
+
+        # Find all <p> tags
+        for p in root.iter("p"):
+            if len(p) == 0 and not (p.text or "").strip():
+                # Childless, blank <p>: a blank line on either platform, no lookups needed
+                lines.append("\n")
+                continue
+            if platform == 'kobo':
+                # Extract text from all <span> elements with class="koboSpan"
+                paragraph_text = kobo_paragraph_text(p, spans_by_p.get(p, ()), plain)
+                if paragraph_text is not None:  # Only process <p> tags with koboSpan elements
+                    # Write to output file, including section markers like ◇
+                    if paragraph_text:
+                        lines.append(paragraph_text + "\n")
+                else:
+                    # Write a blank line for empty <p> tags (e.g., <p><br/></p>)
+                    lines.append("\n")
+            elif platform == 'kindle':
+                # Ruby becomes kanji(furigana), spans (e.g., class_s91 for punctuation) become their text
+                paragraph_text = kindle_paragraph_text(p)
+                if paragraph_text:
+                    lines.append(paragraph_text + "\n")
+                else:
+                    # Write a blank line for empty <p> tags
+                    lines.append("\n")
+    # Add an extra newline between files
+    lines.append("\n")
+    return "".join(lines)
+
+class _SpineError(Exception):
+    """The spine could not be resolved; raised so that lru_cache never stores the failure."""
+
+@functools.lru_cache(maxsize=8)
+def _resolve_spine(base_dir, container_stamp):
+    """
+    Parse container.xml and the .opf under base_dir/extracted_epub into (xhtml_folder, xhtml_paths, warnings).
+    container_stamp is the (inode, mtime, size) of container.xml, so a freshly extracted book misses the cache.
+    Failures raise _SpineError; warnings are returned so the caller can print them on every lookup.
+    """
+    container_path = os.path.join(base_dir, "extracted_epub", "META-INF", "container.xml")
+    try:
+        tree = etree.parse(container_path, _METADATA_PARSER)
+        root = tree.getroot()
+        namespace = {'ns': 'urn:oasis:names:tc:opendocument:xmlns:container'}
+        opf_path = root.find('.//ns:rootfile[@media-type="application/oebps-package+xml"]', namespace).attrib['full-path']
+    except (etree.XMLSyntaxError, AttributeError) as e:
+        raise _SpineError(f"Error parsing container.xml: {e}")
+
+    # Step 2: Parse the .opf file to find XHTML files
+    opf_full_path = os.path.join(base_dir, "extracted_epub", opf_path)
+    if not os.path.exists(opf_full_path):
+        raise _SpineError(f"Error: .opf file not found at {opf_full_path}")
+
+    warnings = []
+    try:
+        tree = etree.parse(opf_full_path, _METADATA_PARSER)
+        root = tree.getroot()
+        namespace = {'opf': 'http://www.idpf.org/2007/opf'}
+
+        # Get manifest (map id to href)
+        manifest = {}
+        for item in root.findall('.//opf:manifest/opf:item', namespace):
+            if item.attrib.get('media-type') == 'application/xhtml+xml':
+                manifest[item.attrib['id']] = item.attrib['href']
+
+        # Get spine (reading order)
+        spine = [itemref.attrib['idref'] for itemref in root.findall('.//opf:spine/opf:itemref', namespace)]
+
+        # Build list of XHTML file paths in spine order
+        content_dir = os.path.dirname(opf_path)  # e.g., 'OEBPS'
+        content_root = Path(base_dir) / "extracted_epub" / content_dir
+        candidates = [content_root / manifest[idref] for idref in spine if idref in manifest]
+        xhtml_files = [full_path for full_path in candidates if full_path.is_file()]
+        if len(xhtml_files) != len(candidates):
+            found_files = set(xhtml_files)
+            for full_path in candidates:
+                if full_path not in found_files:
+                    warnings.append(f"Warning: XHTML file not found at {full_path}")
+        # Set folder from first valid file
+        xhtml_folder = str(xhtml_files[0].parent) if xhtml_files else None
+
+        if not xhtml_files:
+            # Fallback to searching for XHTML files if spine parsing fails
+            warnings.append("Warning: No valid XHTML files found in manifest. Attempting fallback search.")
+            found = find_subfolder_paths(os.path.join(base_dir, "extracted_epub"), ["Text", "xhtml", content_dir])
+            xhtml_dir = found.get("Text") or found.get("xhtml") or found.get(content_dir)
+            if xhtml_dir:
+                xhtml_files = sorted(list_xhtml_files(xhtml_dir), key=get_file_number)
+                xhtml_folder = xhtml_dir
+            else:
+                raise _SpineError("\n".join(warnings + ["Error: No XHTML files found in fallback search."]))
+
+        # Hashable result so lru_cache can hold it; find_xhtml_files turns it back into Paths
+        return xhtml_folder, tuple(str(path) for path in xhtml_files), tuple(warnings)
+    except (etree.XMLSyntaxError, AttributeError) as e:
+        raise _SpineError(f"Error parsing .opf file: {e}")
+
+def find_spine_files(base_dir):
+    """
+    Return (xhtml_folder, xhtml_paths) for base_dir/extracted_epub, paths as strings in spine order,
+    or (None, None) if not found. Successful spine lookups are memoized per extracted book.
+    """
+    container_path = os.path.join(base_dir, "extracted_epub", "META-INF", "container.xml")
+    try:
+        st = os.stat(container_path)
+    except FileNotFoundError:
+        print("Error: container.xml not found.")
+        return None, None
+    try:
+        xhtml_folder, xhtml_files, warnings = _resolve_spine(base_dir, (st.st_ino, st.st_mtime_ns, st.st_size))
+    except _SpineError as e:
+        print(e)
+        return None, None
+    for warning in warnings:
+        print(warning)
+    return xhtml_folder, xhtml_files
+
+def _file_digest(content):
+    return hashlib.blake2b(content, digest_size=16).digest()
+
+def _inputs_digest(xhtml_files, platform, file_digests=None):
+    """
+    Digest of the platform and every XHTML file's path and bytes, used to skip unchanged re-extractions.
+    file_digests (from _extract_with_digest) saves reading the files again.
+    """
+    if file_digests is None:
+        file_digests = []
+        for file_path in xhtml_files:
+            with open(file_path, "rb") as infile:
+                file_digests.append(_file_digest(infile.read()))
+    digest = hashlib.blake2b(platform.encode("utf-8"), digest_size=16)
+    for file_path, file_digest in zip(xhtml_files, file_digests):
+        digest.update(os.fsencode(file_path) + b"\0" + file_digest)
+    return digest.hexdigest()
 
 class TextExtractor:
     def __init__(self, input_dir, output_file, platform, translation_file="temp/translation_cache.json"):
@@ -33,73 +273,10 @@ class TextExtractor:
         Locate the folder containing XHTML files and return a list of XHTML file paths in spine order.
         Returns a tuple: (xhtml_folder, xhtml_files) or (None, None) if not found.
         """
-        # Step 1: Parse container.xml to find the .opf file
-        container_path = os.path.join(self.base_dir, "extracted_epub", "META-INF", "container.xml")
-        if not os.path.exists(container_path):
-            print("Error: container.xml not found.")
-            return None, None
-
-        try:
-            tree = ET.parse(container_path)
-            root = tree.getroot()
-            namespace = {'ns': 'urn:oasis:names:tc:opendocument:xmlns:container'}
-            opf_path = root.find('.//ns:rootfile[@media-type="application/oebps-package+xml"]', namespace).attrib['full-path']
-        except (ET.ParseError, AttributeError) as e:
-            print(f"Error parsing container.xml: {e}")
-            return None, None
-
-        # Step 2: Parse the .opf file to find XHTML files
-        opf_full_path = os.path.join(self.base_dir, "extracted_epub", opf_path)
-        if not os.path.exists(opf_full_path):
-            print(f"Error: .opf file not found at {opf_full_path}")
-            return None, None
-
-        try:
-            tree = ET.parse(opf_full_path)
-            root = tree.getroot()
-            namespace = {'opf': 'http://www.idpf.org/2007/opf'}
-
-            # Get manifest (map id to href)
-            manifest = {}
-            for item in root.findall('.//opf:manifest/opf:item', namespace):
-                if item.attrib.get('media-type') == 'application/xhtml+xml':
-                    manifest[item.attrib['id']] = item.attrib['href']
-
-            # Get spine (reading order)
-            spine = [itemref.attrib['idref'] for itemref in root.findall('.//opf:spine/opf:itemref', namespace)]
-
-            # Build list of XHTML file paths in spine order
-            xhtml_files = []
-            content_dir = os.path.dirname(opf_path)  # e.g., 'OEBPS'
-            xhtml_folder = None
-            for idref in spine:
-                if idref in manifest:
-                    xhtml_path = manifest[idref]
-                    full_path = Path(self.base_dir) / "extracted_epub" / content_dir / xhtml_path
-                    if full_path.exists():
-                        xhtml_files.append(full_path)
-                        if xhtml_folder is None:
-                            xhtml_folder = str(full_path.parent)  # Set folder from first valid file
-                    else:
-                        print(f"Warning: XHTML file not found at {full_path}")
-
-            if not xhtml_files:
-                # Fallback to searching for XHTML files if spine parsing fails
-                print("Warning: No valid XHTML files found in manifest. Attempting fallback search.")
-                xhtml_dir = (find_subfolder_path(os.path.join(self.base_dir, "extracted_epub"), "Text") or
-                             find_subfolder_path(os.path.join(self.base_dir, "extracted_epub"), "xhtml") or
-                             find_subfolder_path(os.path.join(self.base_dir, "extracted_epub"), content_dir))
-                if xhtml_dir:
-                    xhtml_files = sorted(Path(xhtml_dir).glob("*.xhtml"), key=get_file_number)
-                    xhtml_folder = xhtml_dir
-                else:
-                    print("Error: No XHTML files found in fallback search.")
-                    return None, None
-
-            return xhtml_folder, xhtml_files
-        except (ET.ParseError, AttributeError) as e:
-            print(f"Error parsing .opf file: {e}")
+        xhtml_folder, xhtml_files = find_spine_files(self.base_dir)
+        if xhtml_files is None:
             return None, None
+        return xhtml_folder, [Path(path) for path in xhtml_files]
 
     def extract_text(self):
         output_file = os.path.join(self.base_dir, self.output_file)
@@ -114,62 +291,39 @@ class TextExtractor:
         print(f"Found XHTML directory: {xhtml_dir}")
         print(f"Found {len(xhtml_files)} XHTML files.")
 
-        # Open the output file to write the extracted text
+        # Skip the parse when the same inputs already produced output_file; the inputs are only
+        # hashed up front when there is a previous output and stamp to compare against
+        stamp_file = output_file + ".stamp"
+        if os.path.exists(output_file):
+            try:
+                with open(stamp_file, "r", encoding="utf-8") as f:
+                    if f.read() == _inputs_digest(xhtml_files, self.platform):
+                        print(f"Extracted text is up to date: {output_file}")
+                        return
+            except OSError:
+                pass
+
+        # Write to a temp file and swap it in before stamping, so an interrupted run never leaves
+        # partial text paired with a stamp that still matches the inputs
         os.makedirs(os.path.dirname(output_file), exist_ok=True)
-        with open(output_file, "w", encoding="utf-8") as outfile:
-            # Process each XHTML file in spine order
-            for file_path in xhtml_files:
-                # Read the XHTML file
-                with open(file_path, "r", encoding="utf-8") as infile:
-                    content = infile.read()
-
-                # Parse the XHTML content with BeautifulSoup
-                soup = BeautifulSoup(content, "lxml")
-
-                # Find all <p> tags
-                paragraphs = soup.find_all("p")
-                for p in paragraphs:
-                    if self.platform == 'kobo':
-                        # Extract text from all <span> elements with class="koboSpan"
-                        spans = p.find_all("span", class_="koboSpan")
-                        if spans:  # Only process <p> tags with koboSpan elements
-                            paragraph_text = "".join(span.get_text(strip=True) for span in spans)
-                            # Write to output file, including section markers like ◇
-                            if paragraph_text:
-                                outfile.write(paragraph_text + "\n")
-                            # Update the <p> tag's content
-                            p.clear()
-                            p.append(paragraph_text)
-                        else:
-                            # Write a blank line for empty <p> tags (e.g., <p><br/></p>)
-                            outfile.write("\n")
-                    elif self.platform == 'kindle':
-                        # Handle <ruby> tags for furigana
-                        ruby_tags = p.find_all("ruby")
-                        for ruby in ruby_tags:
-                            rb = ruby.find("rb")  # Kanji
-                            rt = ruby.find("rt")  # Furigana
-                            if rb and rt:
-                                # Replace <ruby> with kanji and furigana in parentheses
-                                ruby.replace_with(f"{rb.get_text(strip=True)}({rt.get_text(strip=True)})")
-                            elif rb:
-                                ruby.replace_with(rb.get_text(strip=True))  # Fallback to kanji only
-
-                        # Extract text from <span> elements (e.g., class_s91 for punctuation)
-                        spans = p.find_all("span")
-                        for span in spans:
-                            span.replace_with(span.get_text(strip=True))  # Replace span with its text
-
-                        # Get the cleaned paragraph text
-                        paragraph_text = p.get_text(strip=True)
-                        if paragraph_text:
-                            outfile.write(paragraph_text + "\n")
-                        else:
-                            # Write a blank line for empty <p> tags
-                            outfile.write("\n")
-
-                # Add an extra newline between files
-                outfile.write("\n")
+        tmp_file = output_file + ".tmp"
+        try:
+            with open(tmp_file, "w", encoding="utf-8", buffering=1 << 20) as outfile:
+                # Files are independent, so parse them in parallel; map keeps spine order
+                # Each worker hashes the bytes it already read, so the stamp costs no extra pass over the files
+                jobs = [(str(file_path), self.platform) for file_path in xhtml_files]
+                file_digests = []
+                with ProcessPoolExecutor() as executor:  # os.cpu_count() workers, capped at 61 on Windows
+                    for file_text, file_digest in executor.map(_extract_with_digest, jobs, chunksize=8):
+                        outfile.write(file_text)
+                        file_digests.append(file_digest)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+        os.replace(tmp_file, output_file)
+        with open(stamp_file, "w", encoding="utf-8") as f:
+            f.write(_inputs_digest(xhtml_files, self.platform, file_digests))
 
         print(f"Text extracted to {output_file}")
 
@@ -190,16 +344,13 @@ class TextExtractor:
             return
 
         with open(text_file_path, "r", encoding="utf-8") as infile:
-            lines = infile.readlines()
-            for line in lines:
-                line = line.strip()
-                if line:  # Only include non-empty lines
-                    self.translations[line] = ""
+            # Only include non-empty lines; dict.fromkeys drops repeats and keeps first-seen order
+            self.translations = dict.fromkeys(filter(None, (line.strip() for line in infile)), "")
 
         # Save translations to JSON file in temp/translation_cache.json
         os.makedirs(os.path.dirname(self.translation_file), exist_ok=True)
-        with open(self.translation_file, "w", encoding="utf-8") as outfile:
-            json.dump(self.translations, outfile, ensure_ascii=False, indent=2)
+        with open(self.translation_file, "wb") as outfile:
+            outfile.write(dumps_json(self.translations))
 
         print(f"Translation cache generated at {self.translation_file}")
 
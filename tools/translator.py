@@ -1,42 +1,109 @@
-from openai import OpenAI
+from openai import OpenAI, RateLimitError, APIConnectionError, InternalServerError, BadRequestError
 import os
 import re
 import json
+import functools
+import collections
+import io
+import time
+import hashlib
+import itertools
+import random
+import unicodedata
 import glob
 from typing import List, Dict
-from bs4 import BeautifulSoup
-import sys
+from lxml import etree
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from pathlib import Path
-from tools.text_extractor import TextExtractor
+from tools.text_extractor import find_spine_files, stripped_text
+from tools.file_manager import get_base_path, dumps_json, loads_json
 
-def get_base_path():
-    """Return the base path for the application (handles PyInstaller bundle)."""
-    if getattr(sys, 'frozen', False):
-        return os.path.dirname(sys.executable)
-    else:
-        return os.getcwd()
+def max_parallel_requests(default: int = 8) -> int:
+    """Number of concurrent API requests; override with the OPENAI_MAX_PARALLEL environment variable."""
+    try:
+        return max(1, int(os.environ.get("OPENAI_MAX_PARALLEL", default)))
+    except ValueError:
+        return default
 
-def get_file_number(filename):
-    """Extract numerical part from filename for sorting."""
-    match = re.search(r'(\d+)', os.path.basename(filename))
-    return int(match.group(1)) if match else float('inf')
+class TranslationCancelled(Exception):
+    """Raised when a translation run is cancelled (e.g. the window was closed) before it finished."""
+
+def map_cancellable(executor, fn, items, cancel_event, max_pending):
+    """
+    Like executor.map, but keeps at most max_pending calls queued and stops once cancel_event is set.
+    On cancel, queued calls are dropped and TranslationCancelled is raised; running calls finish on their own.
+    """
+    def call(item):
+        if cancel_event.is_set():
+            raise TranslationCancelled()
+        return fn(item)
+
+    items = iter(items)
+    pending = collections.deque(executor.submit(call, item) for item in itertools.islice(items, max_pending))
+    try:
+        while pending:
+            result = pending.popleft().result()
+            if cancel_event.is_set():
+                raise TranslationCancelled()
+            pending.extend(executor.submit(call, item) for item in itertools.islice(items, 1))
+            yield result
+    except TranslationCancelled:
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+
+_JAPANESE_RE = re.compile('[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF\uFF00-\uFFEF]')
+_JAPANESE_SPECIFIC_RE = re.compile(r'[ぁ-んァ-ン]')
+_ENGLISH_RE = re.compile(r'[a-zA-Z]')  # Basic English detection
+_PUNCTUATION_ONLY_RE = re.compile(r'^[「」…―\s]+\Z')  # Detects punctuation-only strings
+_JAPANESE_IN_BLANKET_RE = re.compile(r'\([ぁ-んァ-ン]\)')
+_BRACKETED_RE = re.compile(r'\([^()]*\)')
+_NUMBER_PREFIX_RE = re.compile(r'^\d+\.\s*')
+
+# Rate limits, dropped connections/timeouts and 5xx responses are worth retrying; anything else fails fast
+TRANSIENT_API_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+# 400 codes meaning this particular batch is too big; smaller batches can succeed
+_BATCH_TOO_LARGE_CODES = {"context_length_exceeded", "string_above_max_length"}
+# A batch that is too long, or whose response is truncated or misnumbered, is halved at most this many times
+MAX_BATCH_SPLIT_DEPTH = 3
+
+# Batch budget: Japanese is roughly one token per character, so len(text) approximates prompt size
+MAX_BATCH_CHARS = 3000
+MAX_BATCH_ITEMS = 50
+
+def pack_batches(texts: List[str], max_chars: int = MAX_BATCH_CHARS, max_items: int = MAX_BATCH_ITEMS) -> List[List[str]]:
+    """Greedily group texts into batches of at most max_items entries and (about) max_chars characters."""
+    batches = []
+    cur = []
+    cur_len = 0
+    for text in texts:
+        # An oversized single text still gets a batch of its own
+        if cur and (cur_len + len(text) > max_chars or len(cur) >= max_items):
+            batches.append(cur)
+            cur = []
+            cur_len = 0
+        cur.append(text)
+        cur_len += len(text)
+    if cur:
+        batches.append(cur)
+    return batches
+
+def normalize_key(text: str) -> str:
+    """NFKC-fold text (full-width/half-width forms, ideographic spaces) and strip it, for whitespace-tolerant lookups."""
+    return unicodedata.normalize('NFKC', text).strip()
+
+def clean_response_lines(text: str) -> List[str]:
+    """Split a batch response into its non-blank lines, stripped and without "1. " style prefixes, in one pass."""
+    strip_prefix = _NUMBER_PREFIX_RE.sub
+    return [strip_prefix('', line, count=1) for line in map(str.strip, text.split('\n')) if line]
 
 class TextAnalyzer:
     """Handles text analysis for Japanese and English character detection"""
-    
-    def __init__(self):
-        self.japanese_pattern = re.compile(
-            '[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF\uFF00-\uFFEF]'
-        )
-        self.japanese_specific_pattern = re.compile(r'[ぁ-んァ-ン]')
-        self.english_pattern = re.compile(r'[a-zA-Z]')  # Basic English detection
-        self.punctuation_only_pattern = re.compile(r'^[「」…―\s]+$')  # Detects punctuation-only strings
-        self.japanese_in_blanket_pattern = re.compile(r'\([ぁ-んァ-ン]\)')
 
     def _remove_bracketed_content(self, text: str) -> str:
         """Remove content inside parentheses (handles nested). Japanese inside () is ignored for untranslated check."""
         while True:
-            new_text = re.sub(r'\([^()]*\)', '', text)
+            new_text = _BRACKETED_RE.sub('', text)
             if new_text == text:
                 break
             text = new_text
@@ -44,23 +111,26 @@ class TextAnalyzer:
 
     def has_japanese_outside_brackets(self, text: str) -> bool:
         """True if text contains Japanese (ぁ-んァ-ン) outside parentheses. Japanese inside () is not counted as untranslated."""
+        # Most values are fully translated; with no kana at all there is nothing to strip brackets for
+        if not _JAPANESE_SPECIFIC_RE.search(text):
+            return False
         remaining = self._remove_bracketed_content(text)
-        return bool(self.japanese_specific_pattern.search(remaining))
+        return bool(_JAPANESE_SPECIFIC_RE.search(remaining))
 
     def is_japanese(self, text: str) -> bool:
         """Check if text contains Japanese characters"""
-        return bool(self.japanese_pattern.search(text))
+        return bool(_JAPANESE_RE.search(text))
 
     def is_japanese_specific(self, text: str) -> bool:
         """Check if text contains Japanese-specific characters (hiragana/katakana)"""
-        return bool(self.japanese_specific_pattern.search(text))
+        return bool(_JAPANESE_SPECIFIC_RE.search(text))
 
     def is_japanese_in_blanket(self, text: str) -> bool:
-        return bool(self.japanese_in_blanket_pattern.search(text))
+        return bool(_JAPANESE_IN_BLANKET_RE.search(text))
 
     def is_english(self, text: str) -> bool:
         """Check if text contains English characters"""
-        return bool(self.english_pattern.search(text))
+        return bool(_ENGLISH_RE.search(text))
 
     def is_untranslated(self, ch_text: str) -> bool:
         """Check if text contains Japanese outside brackets (for JSON validation). Japanese inside () is not counted."""
@@ -68,42 +138,118 @@ class TextAnalyzer:
 
     def is_punctuation_only(self, text: str) -> bool:
         """Check if text consists only of punctuation or whitespace"""
-        return bool(self.punctuation_only_pattern.match(text))
+        return bool(_PUNCTUATION_ONLY_RE.match(text))
+
+# Stateless, so one shared instance serves every translator and processor
+TEXT_ANALYZER = TextAnalyzer()
+
+@functools.lru_cache(maxsize=8)
+def load_prompts(target_language: str) -> dict:
+    """Load language-specific prompts from language_prompt.json (read once per target language)."""
+    # Define both possible paths
+    primary_path = os.path.join(get_base_path(), "..", "Resources", "prompts", "language_prompt.json")
+    fallback_path = os.path.join(get_base_path(), "_internal", "prompts", "language_prompt.json")
+    
+    # List of paths to try
+    possible_paths = [primary_path, fallback_path]
+    
+    for prompt_file in possible_paths:
+        try:
+            with open(prompt_file, 'r', encoding='utf-8') as f:
+                prompts = json.load(f)
+                if target_language not in prompts:
+                    raise ValueError(f"No prompts found for target language: {target_language} in {prompt_file}")
+                required_keys = ["batch_prompt", "batch_system_prompt", "single_prompt", "single_system_prompt"]
+                for key in required_keys:
+                    if key not in prompts[target_language]:
+                        raise ValueError(f"Missing required prompt key '{key}' for language '{target_language}' in {prompt_file}")
+                return prompts[target_language]
+        except FileNotFoundError:
+            continue  # Try the next path if the current one doesn't exist
+        except json.JSONDecodeError:
+            raise ValueError(f"Error decoding JSON in {prompt_file}. Please ensure it is valid JSON.")
+        except Exception as e:
+            raise Exception(f"Error loading prompts from {prompt_file}: {e}")
+
+    # If none of the paths work, raise an error
+    raise FileNotFoundError(f"Prompt file not found in any of the locations: {', '.join(possible_paths)}")
 
 class TranslationCache:
     """Manages caching of translations"""
     
-    def __init__(self, cache_file: str = "temp/translation_cache.json"):
+    def __init__(self, cache_file: str = "temp/translation_cache.json", flush_every: int = 200):
         self.base_dir = get_base_path()
         self.cache_file = os.path.join(self.base_dir, cache_file)
         self.cache = self._load_cache()
+        # Batches are translated concurrently, so mutations and saves must not interleave
+        self._lock = threading.Lock()
+        # Rewriting the whole file on every set() is quadratic; save every flush_every changes instead
+        self.flush_every = flush_every
+        self._writes_since_flush = 0
+        # Keys whose cached translation was already rejected; retry passes skip re-validating them
+        self._bad_keys = set()
 
     def _load_cache(self) -> dict:
         try:
-            with open(self.cache_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(self.cache_file, 'rb') as f:
+                return loads_json(f.read())
         except (FileNotFoundError, json.JSONDecodeError):
             return {}
 
     def save_cache(self):
         os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
-        with open(self.cache_file, 'w', encoding='utf-8') as f:
-            json.dump(self.cache, f, ensure_ascii=False, indent=2)
+        tmp_file = self.cache_file + ".tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(dumps_json(self.cache))
+        os.replace(tmp_file, self.cache_file)
+        self._writes_since_flush = 0
+
+    def flush(self):
+        """Write pending changes to disk."""
+        with self._lock:
+            if self._writes_since_flush:
+                self.save_cache()
 
     def get(self, text: str) -> str:
         return self.cache.get(text)
 
+    def get_valid(self, text: str, analyzer: TextAnalyzer):
+        """Return the cached translation of text, or None if missing or invalid (identical or still Japanese)."""
+        if text in self._bad_keys:
+            return None
+        translation = self.cache.get(text)
+        if not translation:
+            return None
+        if text == translation or analyzer.has_japanese_outside_brackets(translation):
+            print(f"Ignoring invalid cached translation for '{text}': '{translation}'")
+            self._bad_keys.add(text)
+            return None
+        return translation
+
     def set(self, text: str, translation: str):
-        self.cache[text] = translation
-        self.save_cache()
+        with self._lock:
+            self.cache[text] = translation
+            self._bad_keys.discard(text)
+            self._writes_since_flush += 1
+            if self._writes_since_flush >= self.flush_every:
+                self.save_cache()
 
 class Translator:
     """Handles translation operations using OpenAI API"""
     
-    def __init__(self, api_url: str, api_key: str, model: str, target_language: str = "traditional_chinese", extra_body: dict = None):
-        self.client = OpenAI(base_url=api_url, api_key=api_key)
+    def __init__(self, api_url: str, api_key, model: str, target_language: str = "traditional_chinese", extra_body: dict = None):
+        # api_key may be a list, or a comma-separated string, to spread requests over several keys
+        keys = api_key if isinstance(api_key, (list, tuple)) else api_key.split(",")
+        keys = [k.strip() for k in keys if k.strip()] or [api_key]
+        self._clients = [OpenAI(base_url=api_url, api_key=k) for k in keys]
+        # The Batch API (files and batch ids are per key) always uses the first key
+        self.client = self._clients[0]
+        self._client_order = itertools.cycle(range(len(self._clients)))
+        self._client_lock = threading.Lock()
+        # Client index -> (time it may be used again, current cooldown in seconds)
+        self._cooldowns = {}
         self.model = model
-        self.text_analyzer = TextAnalyzer()
+        self.text_analyzer = TEXT_ANALYZER
         self.target_language = target_language
         self.prompts = self._load_prompts()
         # e.g. {"reasoning": {"enabled": False}} to disable reasoning and speed up translation
@@ -111,67 +257,84 @@ class Translator:
 
     def _load_prompts(self) -> dict:
         """Load language-specific prompts from language_prompt.json."""
-        # Define both possible paths
-        primary_path = os.path.join(get_base_path(), "..", "Resources", "prompts", "language_prompt.json")
-        fallback_path = os.path.join(get_base_path(), "_internal", "prompts", "language_prompt.json")
-        
-        # List of paths to try
-        possible_paths = [primary_path, fallback_path]
-        
-        for prompt_file in possible_paths:
+        return load_prompts(self.target_language)
+
+    def _next_client(self):
+        """Pick the next client round-robin, skipping keys that are cooling down after a 429."""
+        with self._client_lock:
+            now = time.monotonic()
+            for _ in range(len(self._clients)):
+                idx = next(self._client_order)
+                if self._cooldowns.get(idx, (0, 0))[0] <= now:
+                    return idx, 0
+            # Every key is cooling down; use the one that recovers first
+            idx = min(self._cooldowns, key=lambda i: self._cooldowns[i][0])
+            return idx, self._cooldowns[idx][0] - now
+
+    def _chat(self, attempts: int = 3, **kwargs):
+        """
+        Send one chat completion on the next available key, cooling a key down (exponentially) when it hits 429.
+        Transient errors are tried up to attempts times with jittered exponential backoff, then re-raised
+        (on top of the OpenAI client's own quick retries).
+        """
+        for attempt in range(1, attempts + 1):
+            idx, wait = self._next_client()
+            if wait > 0:
+                time.sleep(wait)
             try:
-                with open(prompt_file, 'r', encoding='utf-8') as f:
-                    prompts = json.load(f)
-                    if self.target_language not in prompts:
-                        raise ValueError(f"No prompts found for target language: {self.target_language} in {prompt_file}")
-                    required_keys = ["batch_prompt", "batch_system_prompt", "single_prompt", "single_system_prompt"]
-                    for key in required_keys:
-                        if key not in prompts[self.target_language]:
-                            raise ValueError(f"Missing required prompt key '{key}' for language '{self.target_language}' in {prompt_file}")
-                    return prompts[self.target_language]
-            except FileNotFoundError:
-                continue  # Try the next path if the current one doesn't exist
-            except json.JSONDecodeError:
-                raise ValueError(f"Error decoding JSON in {prompt_file}. Please ensure it is valid JSON.")
-            except Exception as e:
-                raise Exception(f"Error loading prompts from {prompt_file}: {e}")
-    
-        # If none of the paths work, raise an error
-        raise FileNotFoundError(f"Prompt file not found in any of the locations: {', '.join(possible_paths)}")
-
-    def batch_translate_for_json(self, texts: List[str], cache: TranslationCache, batch_size: int = 5) -> Dict[str, str]:
-        """Translate a batch of texts to the target language, expecting newline-separated response."""
+                response = self._clients[idx].chat.completions.create(**kwargs)
+                break
+            except RateLimitError:
+                with self._client_lock:
+                    delay = min(self._cooldowns.get(idx, (0, 0.5))[1] * 2, 60)
+                    self._cooldowns[idx] = (time.monotonic() + delay, delay)
+                print(f"API key {idx + 1} rate limited; cooling down for {delay:.0f}s (attempt {attempt}/{attempts})")
+                if attempt == attempts:
+                    raise
+                # No extra sleep: the next pick waits out the cooldown if no other key is free
+            except TRANSIENT_API_ERRORS as e:
+                if attempt == attempts:
+                    raise
+                delay = min(2 ** (attempt - 1), 30) * random.uniform(0.5, 1.5)
+                print(f"Transient API error ({type(e).__name__}); retrying in {delay:.1f}s (attempt {attempt}/{attempts})")
+                time.sleep(delay)
+        if idx in self._cooldowns:
+            with self._client_lock:
+                self._cooldowns.pop(idx, None)
+        return response
+
+    def batch_translate_for_json(self, texts: List[str], cache: TranslationCache, batch_size: int = 5,
+                                 split_depth: int = 0) -> Dict[str, str]:
+        """
+        Translate a batch of texts to the target language, expecting newline-separated response.
+        Failures specific to this batch (too long, truncated or misnumbered response) split it in half,
+        up to MAX_BATCH_SPLIT_DEPTH times; split_depth counts the splits so far.
+        """
         translations = {}
         if not texts:
             return translations
 
         # Check cache first, but ignore invalid cached translations
         uncached_texts = []
-        for text in texts:
-            cached_translation = cache.get(text)
-            if cached_translation:
-                # Skip cached translation if it has Japanese outside brackets or is identical to original
-                if self.text_analyzer.has_japanese_outside_brackets(cached_translation) or text == cached_translation:
-                    print(f"Ignoring invalid cached translation for '{text}': '{cached_translation}'")
-                    uncached_texts.append(text)
-                else:
-                    translations[text] = cached_translation
-                    print(f"Using cached translation for '{text}': '{cached_translation}'")
-            else:
+        # Each distinct text is looked up and sent once; results are keyed by text, so repeats share them
+        for text in dict.fromkeys(texts):
+            cached_translation = cache.get_valid(text, self.text_analyzer)
+            if cached_translation is None:
                 uncached_texts.append(text)
+            else:
+                translations[text] = cached_translation
+                print(f"Using cached translation for '{text}': '{cached_translation}'")
 
         if not uncached_texts:
             return translations
 
-        prompt = self.prompts["batch_prompt"]
-        for idx, text in enumerate(uncached_texts, 1):
-            prompt += f"{idx}. {text}\n"
+        prompt = self.prompts["batch_prompt"] + "".join(f"{idx}. {text}\n" for idx, text in enumerate(uncached_texts, 1))
 
         try:
             kwargs = {"model": self.model, "temperature": 0.35}
             if self.extra_body:
                 kwargs["extra_body"] = self.extra_body
-            response = self.client.chat.completions.create(
+            response = self._chat(
                 **kwargs,
                 messages=[
                     {
@@ -185,23 +348,21 @@ class Translator:
                 ]
             )
 
-            # Split the response by newlines, accounting for potential extra newlines
-            translation_text = response.choices[0].message.content
-            translated_lines = [line.strip() for line in translation_text.split('\n') if line.strip()]
-            
-            # Remove numbered prefixes (e.g., "1. ", "2. ") if present
-            cleaned_translations = []
-            for line in translated_lines:
-                if re.match(r'^\d+\.', line):
-                    cleaned_translations.append(re.sub(r'^\d+\.\s*', '', line))
-                else:
-                    cleaned_translations.append(line)
+            # One line per text, ignoring blank lines and numbered prefixes (e.g., "1. ", "2. ")
+            choice = response.choices[0]
+            cleaned_translations = clean_response_lines(choice.message.content)
 
             # Ensure the number of translations matches the input
-            if len(cleaned_translations) != len(uncached_texts):
-                print(f"Warning: Expected {len(uncached_texts)} translations, got {len(cleaned_translations)}. Using original texts for mismatches.")
+            if len(cleaned_translations) != len(uncached_texts) or getattr(choice, "finish_reason", None) == "length":
+                problem = f"Expected {len(uncached_texts)} translations, got {len(cleaned_translations)}"
+                if getattr(choice, "finish_reason", None) == "length":
+                    problem += " (response truncated)"
+                if self._can_split(uncached_texts, split_depth):
+                    print(f"Warning: {problem}.")
+                    return self._split_batch(uncached_texts, cache, split_depth, translations)
+                print(f"Warning: {problem}. Using original texts for mismatches.")
                 for text in uncached_texts:
-                    translations[text] = text  # Fallback to original text
+                    translations.setdefault(text, text)  # Fallback to original text
             else:
                 for original, translated in zip(uncached_texts, cleaned_translations):
                     translations[original] = translated
@@ -209,39 +370,52 @@ class Translator:
                     print(f"Cached new translation for '{original}': '{translated}'")
 
             return translations
+        except BadRequestError as e:
+            if getattr(e, "code", None) in _BATCH_TOO_LARGE_CODES and self._can_split(uncached_texts, split_depth):
+                print(f"Batch translation error: {e}.")
+                return self._split_batch(uncached_texts, cache, split_depth, translations)
+            print(f"Batch translation error: {e}")
+            for text in uncached_texts:
+                translations.setdefault(text, text)
+            return translations
         except Exception as e:
+            # Includes TRANSIENT_API_ERRORS once _chat's retries are exhausted: the service is struggling,
+            # so the batch fails as a whole instead of multiplying requests; the next pass retries it
             print(f"Batch translation error: {e}")
-            return {text: text for text in texts}  # Fallback to original texts
+            # Fall back to the original texts, keeping the valid cached translations already found
+            for text in uncached_texts:
+                translations.setdefault(text, text)
+            return translations
+
+    @staticmethod
+    def _can_split(texts: List[str], split_depth: int) -> bool:
+        return len(texts) > 1 and split_depth < MAX_BATCH_SPLIT_DEPTH
+
+    def _split_batch(self, texts: List[str], cache: TranslationCache, split_depth: int,
+                     translations: Dict[str, str]) -> Dict[str, str]:
+        """Translate the two halves of texts separately (a single text goes through translate_single)."""
+        half = len(texts) // 2
+        print(f"Splitting {len(texts)} texts into batches of {half} and {len(texts) - half}.")
+        for part in (texts[:half], texts[half:]):
+            if len(part) == 1:
+                translations[part[0]] = self.translate_single(part[0], cache)
+            else:
+                translations.update(self.batch_translate_for_json(part, cache, split_depth=split_depth + 1))
+        return translations
 
     def translate_single(self, text: str, cache: TranslationCache) -> str:
         """Translate a single text to the target language."""
-        # Check cache first
-        cached_translation = cache.get(text)
-        if cached_translation:
-            # Skip cached translation if it has Japanese outside brackets or is identical to original
-            if self.text_analyzer.has_japanese_outside_brackets(cached_translation) or text == cached_translation:
-                print(f"Ignoring invalid cached translation for '{text}': '{cached_translation}'")
-            else:
-                print(f"Using cached translation for '{text}': '{cached_translation}'")
-                return cached_translation
+        # Check cache first, skipping translations that still contain Japanese or echo the original
+        cached_translation = cache.get_valid(text, self.text_analyzer)
+        if cached_translation is not None:
+            print(f"Using cached translation for '{text}': '{cached_translation}'")
+            return cached_translation
 
         try:
             kwargs = {"model": self.model, "temperature": 0.35}
             if self.extra_body:
                 kwargs["extra_body"] = self.extra_body
-            response = self.client.chat.completions.create(
-                **kwargs,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": self.prompts["single_system_prompt"]
-                    },
-                    {
-                        "role": "user",
-                        "content": self.prompts["single_prompt"].format(text=text)
-                    }
-                ]
-            )
+            response = self._chat(**kwargs, messages=self._single_messages(text))
             translation = response.choices[0].message.content.strip()
             cache.set(text, translation)
             print(f"Cached new translation for '{text}': '{translation}'")
@@ -250,19 +424,90 @@ class Translator:
             print(f"Translation error for '{text}': {e}")
             return text
 
+    def _single_messages(self, text: str) -> List[dict]:
+        return [
+            {"role": "system", "content": self.prompts["single_system_prompt"]},
+            {"role": "user", "content": self.prompts["single_prompt"].format(text=text)}
+        ]
+
+    def submit_batch(self, texts: List[str]) -> str:
+        """Upload one single-prompt request per text to the OpenAI Batch API and return the batch id."""
+        buf = io.BytesIO()
+        for text in texts:
+            body = {"model": self.model, "temperature": 0.35, "messages": self._single_messages(text)}
+            body.update(self.extra_body)
+            request = {
+                "custom_id": hashlib.sha1(text.encode("utf-8")).hexdigest(),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": body
+            }
+            buf.write(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+        batch_file = self.client.files.create(file=("batch_input.jsonl", buf.getvalue()), purpose="batch")
+        batch = self.client.batches.create(input_file_id=batch_file.id, endpoint="/v1/chat/completions",
+                                           completion_window="24h")
+        print(f"Submitted {len(texts)} entries as batch {batch.id}")
+        return batch.id
+
+    def poll_batch(self, batch_id: str, texts: List[str], cache: TranslationCache,
+                   initial_delay: float = 5.0, max_delay: float = 300.0) -> Dict[str, str]:
+        """Wait (with exponential backoff) for a batch to finish and cache its translations."""
+        delay = initial_delay
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            if batch.status == "completed":
+                break
+            if batch.status in ("failed", "expired", "cancelled"):
+                print(f"Batch {batch_id} ended with status '{batch.status}'")
+                return {}
+            print(f"Batch {batch_id} is {batch.status}; checking again in {delay:.0f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+        if not batch.output_file_id:
+            print(f"Batch {batch_id} completed without output")
+            return {}
+        by_id = {hashlib.sha1(text.encode("utf-8")).hexdigest(): text for text in texts}
+        translations = {}
+        for line in self.client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            text = by_id.get(result.get("custom_id"))
+            response = result.get("response") or {}
+            if text is None or response.get("status_code") != 200:
+                continue
+            translation = response["body"]["choices"][0]["message"]["content"].strip()
+            translations[text] = translation
+            cache.set(text, translation)
+            print(f"Cached new translation for '{text}': '{translation}'")
+        return translations
+
+    def batch_api_translate(self, texts: List[str], cache: TranslationCache) -> Dict[str, str]:
+        """Translate texts through the OpenAI Batch API (half price, up to 24h turnaround)."""
+        try:
+            return self.poll_batch(self.submit_batch(texts), texts, cache)
+        except Exception as e:
+            print(f"Batch API error: {e}")
+            return {}
+
 class JsonProcessor:
     """Handles JSON file operations and translation updates"""
     
-    def __init__(self, cache_files: List[str], output_file: str = "temp/updated_translations.json"):
+    def __init__(self, cache_files: List[str], output_file: str = "temp/updated_translations.json", max_workers: int = None,
+                 cancel_event: threading.Event = None):
         self.base_dir = get_base_path()
         self.cache_files = [os.path.join(self.base_dir, f) for f in cache_files]
         self.output_file = os.path.join(self.base_dir, output_file)
-        self.text_analyzer = TextAnalyzer()
+        self.text_analyzer = TEXT_ANALYZER
+        self.max_workers = max_workers or max_parallel_requests()
+        # Set from another thread to stop queuing API calls; queued ones are dropped, running ones finish
+        self.cancel_event = cancel_event or threading.Event()
 
     def load_json(self, cache_file: str) -> Dict[str, str]:
         try:
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(cache_file, 'rb') as f:
+                return loads_json(f.read())
         except FileNotFoundError:
             print(f"Cache file {cache_file} not found. Starting with empty cache.")
             return {}
@@ -272,56 +517,47 @@ class JsonProcessor:
 
     def save_json(self, json_data: Dict[str, str]):
         os.makedirs(os.path.dirname(self.output_file), exist_ok=True)
-        with open(self.output_file, 'w', encoding='utf-8') as f:
-            json.dump(json_data, f, ensure_ascii=False, indent=2)
+        with open(self.output_file, 'wb') as f:
+            f.write(dumps_json(json_data))
 
     def find_untranslated(self, json_data: Dict[str, str], check_japanese: bool = False) -> List[str]:
+        """
+        Return keys whose value is empty, still has Japanese outside brackets, or equals the original.
+        Punctuation-only keys are filled with themselves instead. The initial check and the one after
+        batch translation (check_japanese=True) apply the same rules. Per-entry details are printed
+        only when EPUB_VERBOSE is set.
+        """
+        verbose = bool(os.environ.get("EPUB_VERBOSE"))
+        has_japanese = self.text_analyzer.has_japanese_outside_brackets
+        is_punctuation_only = self.text_analyzer.is_punctuation_only
         untranslated = []
         for jp_text, ch_text in json_data.items():
             if not jp_text:  # Skip empty keys
-                print(f"Skipping empty key in JSON")
+                if verbose:
+                    print(f"Skipping empty key in JSON")
                 continue
-            if check_japanese:
-                # After batch translation: Check for empty, Japanese outside brackets, or identical original/translated
-                if (ch_text == "" or 
-                    self.text_analyzer.has_japanese_outside_brackets(ch_text) or 
-                    jp_text == ch_text):
-                    if self.text_analyzer.is_punctuation_only(jp_text):
-                        # For punctuation-only text, use original text as translation
-                        json_data[jp_text] = jp_text
-                        print(f"Filled punctuation-only text: '{jp_text}' -> '{jp_text}'")
-                    else:
-                        untranslated.append(jp_text)
-                        reason = (
-                            "Empty value" if ch_text == "" else
-                            "Contains Japanese outside brackets" if self.text_analyzer.has_japanese_outside_brackets(ch_text) else
-                            "Translated text identical to original"
-                        )
-                        print(f"Detected untranslated: '{jp_text}' (Reason: {reason})")
-                else:
-                    print(f"Skipping valid translation: '{jp_text}' -> '{ch_text}'")
+            if ch_text == "":
+                reason = "Empty value"
+            elif has_japanese(ch_text):
+                reason = "Contains Japanese outside brackets"
+            elif jp_text == ch_text:
+                reason = "Translated text identical to original"
             else:
-                # Initial check: empty, Japanese outside brackets, or identical original/translated
-                if (ch_text == "" or 
-                    self.text_analyzer.has_japanese_outside_brackets(ch_text) or 
-                    jp_text == ch_text):
-                    if self.text_analyzer.is_punctuation_only(jp_text):
-                        # For punctuation-only text, use original text as translation
-                        json_data[jp_text] = jp_text
-                        print(f"Filled punctuation-only text: '{jp_text}' -> '{jp_text}'")
-                    else:
-                        untranslated.append(jp_text)
-                        reason = (
-                            "Empty value" if ch_text == "" else
-                            "Contains Japanese outside brackets" if self.text_analyzer.has_japanese_outside_brackets(ch_text) else
-                            "Translated text identical to original"
-                        )
-                        print(f"Detected untranslated: '{jp_text}' (Reason: {reason})")
-                else:
+                if verbose:
                     print(f"Skipping valid translation: '{jp_text}' -> '{ch_text}'")
+                continue
+            if is_punctuation_only(jp_text):
+                # For punctuation-only text, use original text as translation
+                json_data[jp_text] = jp_text
+                if verbose:
+                    print(f"Filled punctuation-only text: '{jp_text}' -> '{jp_text}'")
+            else:
+                untranslated.append(jp_text)
+                if verbose:
+                    print(f"Detected untranslated: '{jp_text}' (Reason: {reason})")
         return untranslated
 
-    def process(self, translator: Translator, batch_size: int = 5):
+    def process(self, translator: Translator, max_chars: int = MAX_BATCH_CHARS, max_items: int = MAX_BATCH_ITEMS, use_batch_api: bool = False):
         for cache_file in self.cache_files:
             print(f"Processing cache file: {cache_file}")
             json_data = self.load_json(cache_file)
@@ -329,42 +565,61 @@ class JsonProcessor:
             cache = TranslationCache(cache_file)
             total_translated = 0
 
-            # Repeat until no Japanese outside brackets remains (max 20 retries)
-            max_retries = 20
-            retry_count = 0
-            while retry_count < max_retries:
-                untranslated = self.find_untranslated(updated_json, check_japanese=(total_translated > 0))
-                if not untranslated:
-                    if total_translated == 0:
-                        print("All entries are properly translated or punctuation-only!")
-                    break
-
-                retry_count += 1
-                print(f"Retry {retry_count}/{max_retries}: Found {len(untranslated)} untranslated entries (Japanese outside brackets or empty/identical).")
-                total_this_round = len(untranslated)
-
-                # Batch translate
-                for i in range(0, len(untranslated), batch_size):
-                    batch = untranslated[i:i + batch_size]
-                    print(f"Batch translating batch {i // batch_size + 1} of {((len(untranslated) - 1) // batch_size + 1)} "
-                          f"({len(batch)} entries, {((i + len(batch)) / total_this_round * 100):.2f}% complete)")
-                    translations = translator.batch_translate_for_json(batch, cache, batch_size)
-                    for text, translation in translations.items():
-                        updated_json[text] = translation
-                total_translated += total_this_round
-
-            if retry_count >= max_retries:
-                print(f"Reached maximum retry count ({max_retries}).")
-
-            # Single-call fallback for any still untranslated after loop
-            still_remaining = self.find_untranslated(updated_json, check_japanese=True)
-            if still_remaining:
-                print(f"Found {len(still_remaining)} entries still untranslated after batch retries. Using line-by-line fallback.")
-                for i, text in enumerate(still_remaining, 1):
-                    print(f"Processing entry {i} of {len(still_remaining)} ({(i / len(still_remaining) * 100):.2f}% complete)")
-                    translation = translator.translate_single(text, cache)
-                    updated_json[text] = translation
-                total_translated += len(still_remaining)
+            try:
+                # Repeat until no Japanese outside brackets remains (max 20 retries)
+                max_retries = 20
+                retry_count = 0
+                while retry_count < max_retries:
+                    if self.cancel_event.is_set():
+                        raise TranslationCancelled()
+                    untranslated = self.find_untranslated(updated_json, check_japanese=(total_translated > 0))
+                    if not untranslated:
+                        if total_translated == 0:
+                            print("All entries are properly translated or punctuation-only!")
+                        break
+
+                    retry_count += 1
+                    print(f"Retry {retry_count}/{max_retries}: Found {len(untranslated)} untranslated entries (Japanese outside brackets or empty/identical).")
+                    total_this_round = len(untranslated)
+
+                    if use_batch_api and total_translated == 0:
+                        # First pass goes through the Batch API; retries and the fallback stay synchronous
+                        for text, translation in translator.batch_api_translate(untranslated, cache).items():
+                            updated_json[text] = translation
+                        total_translated += total_this_round
+                        continue
+
+                    # Batch translate; requests are network-bound, so overlap them on a thread pool
+                    batches = pack_batches(untranslated, max_chars, max_items)
+                    with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                        results = map_cancellable(executor, lambda batch: translator.batch_translate_for_json(batch, cache),
+                                                  batches, self.cancel_event, 2 * self.max_workers)
+                        done = 0
+                        for batch_number, (batch, translations) in enumerate(zip(batches, results), 1):
+                            done += len(batch)
+                            print(f"Batch translated batch {batch_number} of {len(batches)} "
+                                  f"({len(batch)} entries, {(done / total_this_round * 100):.2f}% complete)")
+                            for text, translation in translations.items():
+                                updated_json[text] = translation
+                    total_translated += total_this_round
+
+                if retry_count >= max_retries:
+                    print(f"Reached maximum retry count ({max_retries}).")
+
+                # Single-call fallback for any still untranslated after loop
+                still_remaining = self.find_untranslated(updated_json, check_japanese=True)
+                if still_remaining:
+                    print(f"Found {len(still_remaining)} entries still untranslated after batch retries. Using line-by-line fallback.")
+                    with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                        results = map_cancellable(executor, lambda text: translator.translate_single(text, cache),
+                                                  still_remaining, self.cancel_event, 2 * self.max_workers)
+                        for i, (text, translation) in enumerate(zip(still_remaining, results), 1):
+                            print(f"Processing entry {i} of {len(still_remaining)} ({(i / len(still_remaining) * 100):.2f}% complete)")
+                            updated_json[text] = translation
+                    total_translated += len(still_remaining)
+            finally:
+                # Pending cache entries are written before updated_json, as when every set() saved
+                cache.flush()
 
             self.save_json(updated_json)
             print(f"Translated {total_translated} entries in total and saved to '{self.output_file}'")
@@ -372,15 +627,22 @@ class JsonProcessor:
 class TranslatorManager:
     """Coordinates JSON translation processes"""
     
-    def __init__(self, api_url: str, api_key: str, model: str, cache_files: List[str], target_language: str = "traditional_chinese", extra_body: dict = None):
+    def __init__(self, api_url: str, api_key: str, model: str, cache_files: List[str], target_language: str = "traditional_chinese", extra_body: dict = None, max_workers: int = None, use_batch_api: bool = False,
+                 max_chars: int = MAX_BATCH_CHARS, max_items: int = MAX_BATCH_ITEMS, cancel_event: threading.Event = None):
         self.translator = Translator(api_url, api_key, model, target_language, extra_body=extra_body)
-        self.json_processor = JsonProcessor(cache_files)
-        self.text_analyzer = TextAnalyzer()
+        self.json_processor = JsonProcessor(cache_files, max_workers=max_workers, cancel_event=cancel_event)
+        self.text_analyzer = TEXT_ANALYZER
+        # Opt-in: the OpenAI Batch API halves the cost but can take up to 24h
+        self.use_batch_api = use_batch_api
+        # Batches are packed up to a character budget rather than a fixed entry count
+        self.max_chars = max_chars
+        self.max_items = max_items
 
     def process_all(self):
         """Process all translation files"""
         print("Starting JSON translation process...")
-        self.json_processor.process(self.translator, batch_size=20)
+        self.json_processor.process(self.translator, max_chars=self.max_chars, max_items=self.max_items,
+                                    use_batch_api=self.use_batch_api)
 
 class Update_Xhtml_Manager:
     def __init__(self, input_dir: str = "", translations_file: str = "", platform: str = ''):
@@ -397,13 +659,19 @@ class Update_Xhtml_Manager:
         self.translations_file = self.base_dir / translations_file
         self.platform = platform
         self.translations = {}
+        # normalize_key(source) -> translation, consulted only when the exact text misses
+        self.normalized_translations = {}
         self.xhtml_files = []
 
     def load_translations(self):
         """Load translations from JSON file."""
         try:
-            with open(self.translations_file, "r", encoding="utf-8") as f:
-                self.translations = json.load(f)
+            with open(self.translations_file, "rb") as f:
+                self.translations = loads_json(f.read())
+            normalized = {}
+            for text, translation in self.translations.items():
+                normalized.setdefault(normalize_key(text), translation)
+            self.normalized_translations = normalized
             print(f"Loaded {len(self.translations)} translations from '{self.translations_file}'")
             return True
         except Exception as e:
@@ -412,25 +680,17 @@ class Update_Xhtml_Manager:
     
     def get_xhtml_files(self):
         """
-        Get all XHTML files in spine order using TextExtractor.find_xhtml_files.
+        Get all XHTML files in spine order (the same lookup TextExtractor.find_xhtml_files uses).
         Returns the number of XHTML files found.
         """
-        # Create a temporary TextExtractor instance to use its find_xhtml_files method
-        extractor = TextExtractor(
-            input_dir=str(self.input_dir),
-            output_file="dummy.txt",  # Dummy value, not used
-            platform=self.platform
-        )
-        
-        # Call find_xhtml_files (expects string base_dir)
-        xhtml_folder, xhtml_files = extractor.find_xhtml_files()
+        # String paths straight from the memoized spine lookup; no extractor or Path round trip needed
+        xhtml_folder, xhtml_files = find_spine_files(get_base_path())
         
         if not xhtml_folder or not xhtml_files:
             print("Error: No XHTML files found.")
             return 0
         
-        # Convert Path objects to strings for compatibility with update_xhtml_files
-        self.xhtml_files = [str(file) for file in xhtml_files]
+        self.xhtml_files = list(xhtml_files)
         print(f"Found {len(self.xhtml_files)} XHTML files in '{xhtml_folder}'")
         return len(self.xhtml_files)
     
@@ -439,55 +699,23 @@ class Update_Xhtml_Manager:
         if not self.xhtml_files:
             self.get_xhtml_files()
         
+        # Files are independent; each worker receives the translations once via the initializer.
+        # The default worker count is os.cpu_count(), capped at the 61 that Windows allows
         updated_count = 0
-        for file_path in self.xhtml_files:
-            if self._update_single_file(file_path):
-                updated_count += 1
+        with ProcessPoolExecutor(initializer=_init_update_worker,
+                                 initargs=(self.translations, self.normalized_translations)) as executor:
+            for updated, message in executor.map(_update_one, self.xhtml_files, chunksize=8):
+                print(message)
+                if updated:
+                    updated_count += 1
         
         return updated_count
     
     def _update_single_file(self, file_path):
         """Update a single XHTML file with translations."""
-        try:
-            # Read the XHTML file
-            with open(file_path, "r", encoding="utf-8") as infile:
-                content = infile.read()
-            
-            # Parse the XHTML content with BeautifulSoup
-            soup = BeautifulSoup(content, "lxml")
-            
-            # Find all <p> tags
-            paragraphs = soup.find_all("p")
-            changes_made = False
-            
-            for p in paragraphs:
-                # Skip <p> tags with <br/> or structural markers like ◇
-                if p.find("br") or p.get_text(strip=True) == "◇":
-                    continue
-                
-                # Extract the text content of the <p> tag
-                paragraph_text = p.get_text(strip=True)
-                
-                # Check if the text has a translation
-                if paragraph_text in self.translations:
-                    # Clear the <p> tag's contents
-                    p.clear()
-                    # Append the translated text
-                    p.append(self.translations[paragraph_text])
-                    changes_made = True
-            
-            # Write the modified XHTML back to the original file if changes were made
-            if changes_made:
-                with open(file_path, "w", encoding="utf-8") as outfile:
-                    outfile.write(str(soup))
-                print(f"Updated XHTML file: '{file_path}'")
-                return True
-            
-            print(f"No changes made to XHTML file: '{file_path}'")
-            return False
-        except Exception as e:
-            print(f"Error updating file '{file_path}': {e}")
-            return False
+        updated, message = _apply_translations(file_path, self.translations, self.normalized_translations)
+        print(message)
+        return updated
     
     def run(self):
         """Run the entire translation process."""
@@ -501,12 +729,81 @@ class Update_Xhtml_Manager:
         updated_count = self.update_xhtml_files()
         return f"Updated {updated_count} of {file_count} XHTML files with translations from '{self.translations_file}'"
 
-def gpt_translation(api_url: str, api_key: str, model: str, platform: str, input_dir: str, translation_json: str, target_language: str = "traditional_chinese", extra_body: dict = None):
+# The tree is written back, so keep blank text; no DTD loading or id bookkeeping
+_UPDATE_PARSER = etree.XMLParser(huge_tree=True, recover=True, load_dtd=False, no_network=True, collect_ids=False)
+_worker_translations = {}
+_worker_normalized = {}
+
+def _init_update_worker(translations, normalized=None):
+    """Process pool initializer: keep the translations maps for every file this worker handles."""
+    global _worker_translations, _worker_normalized
+    _worker_translations = translations
+    _worker_normalized = normalized or {}
+
+def _update_one(file_path):
+    """Update a single XHTML file. Runs in a worker process."""
+    return _apply_translations(file_path, _worker_translations, _worker_normalized)
+
+def _apply_translations(file_path, translations, normalized=None):
+    """
+    Replace translated <p> texts in one XHTML file; returns (updated, log message).
+    normalized (normalize_key(source) -> translation) catches paragraphs whose whitespace or width forms drifted.
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            content = f.read()
+        # Files without any <p> (covers, image pages, nav) cannot match; skip the parse
+        if b"<p" not in content and b":p" not in content:
+            return False, f"No changes made to XHTML file: '{file_path}'"
+
+        # Parse the raw bytes with lxml directly; libxml2 decodes them natively, with no Python-level str round-trip
+        root = etree.fromstring(content, _UPDATE_PARSER)
+        tree = root.getroottree() if root is not None else None
+        changes_made = False
+        lookup = translations.get
+        normalized_lookup = (normalized or {}).get
+        
+        # Find all <p> tags (collected first, since translated paragraphs lose their children)
+        for p in list(root.iter("{*}p")) if root is not None else ():
+            # Skip <p> tags with <br/> or structural markers like ◇
+            if next(p.iter("{*}br"), None) is not None:
+                continue
+            
+            # Extract the text content of the <p> tag, stripped per text node like the extractor
+            paragraph_text = stripped_text(p)
+            if paragraph_text == "◇":
+                continue
+            
+            # Check if the text has a translation (one hash and lookup per paragraph)
+            translation = lookup(paragraph_text)
+            if translation is None:
+                translation = normalized_lookup(normalize_key(paragraph_text))
+            if translation is not None:
+                # Replace the <p> tag's contents (attributes and tail are kept)
+                for child in list(p):
+                    p.remove(child)
+                p.text = translation
+                changes_made = True
+        
+        # Write the modified XHTML back to the original file if changes were made
+        if changes_made:
+            tree.write(file_path, encoding="utf-8", xml_declaration=True)
+            return True, f"Updated XHTML file: '{file_path}'"
+        
+        return False, f"No changes made to XHTML file: '{file_path}'"
+    except Exception as e:
+        return False, f"Error updating file '{file_path}': {e}"
+
+def gpt_translation(api_url: str, api_key: str, model: str, platform: str, input_dir: str, translation_json: str, target_language: str = "traditional_chinese", extra_body: dict = None, use_batch_api: bool = False,
+                    cancel_event: threading.Event = None):
     """Main function to run the translation and XHTML update process.
     Pass extra_body e.g. {"reasoning": {"enabled": False}} to disable reasoning and speed up (recommended for translation).
+    Set use_batch_api to send the first pass through the OpenAI Batch API (cheaper, but slow to complete).
+    Setting cancel_event stops the run with TranslationCancelled before the XHTML files are touched.
     """
     # Configuration
     base_dir = get_base_path()
+    # Processed in order, not concurrently: the second pass re-checks the output written by the first
     cache_files = [
         os.path.join(base_dir, 'temp', 'translation_cache.json'),
         os.path.join(base_dir, 'temp', 'updated_translations.json')
@@ -518,7 +815,8 @@ def gpt_translation(api_url: str, api_key: str, model: str, platform: str, input
     os.makedirs(os.path.join(base_dir, 'temp'), exist_ok=True)
 
     # Initialize and run the manager
-    manager = TranslatorManager(api_url, api_key, model, cache_files, target_language=target_language, extra_body=extra_body)
+    manager = TranslatorManager(api_url, api_key, model, cache_files, target_language=target_language, extra_body=extra_body,
+                                use_batch_api=use_batch_api, cancel_event=cancel_event)
     manager.process_all()
 
     xhtml_updator = Update_Xhtml_Manager(input_dir=input_dir, translations_file=translation_json, platform=platform)